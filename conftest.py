@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.fixture(scope='session', autouse=True)
+def temporary_cache():
+    """Кэш тестов во временном файле, см. core.testing."""
+    from core.testing import temporary_cache
+
+    with temporary_cache():
+        yield
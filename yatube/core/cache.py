@@ -0,0 +1,559 @@
+"""Кэш в файле SQLite, общий для всех процессов сервера.
+
+LocMemCache у каждого процесса свой: страница рендерится и хранится
+столько раз, сколько процессов, а процессы видят разные поколения лент.
+Этот кэш хранит записи в одном файле в режиме WAL, так что читатели не
+ждут писателей, а страницы и счётчики поколений общие для всех процессов.
+
+Размер кэша ограничен числом записей MAX_ENTRIES и суммарным размером
+значений OPTIONS['MAX_BYTES']. Лишние записи вытесняются по времени
+последнего обращения (LRU). Чтобы чтение не было записью в базу, время
+обращения и прочитанные истёкшие ключи копятся в памяти и записываются
+пачкой в конце запроса.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Журнал изменённых и удалённых ключей помнит столько последних записей.
+CHANGES_KEPT = 10000
+SCHEMA = """
+BEGIN IMMEDIATE;
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT NOT NULL UNIQUE,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE TABLE IF NOT EXISTS cache_size (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    entries INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_size VALUES (0, 0, 0);
+CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN
+    UPDATE cache_size SET entries = entries + 1, bytes = bytes + new.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN
+    UPDATE cache_size SET entries = entries - 1, bytes = bytes - old.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache
+BEGIN
+    UPDATE cache_size SET bytes = bytes + new.size - old.size;
+END;
+CREATE TABLE IF NOT EXISTS cache_changes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS cache_changed
+AFTER UPDATE OF value, expires ON cache BEGIN
+    INSERT INTO cache_changes (key) VALUES (old.key);
+    DELETE FROM cache_changes WHERE id = last_insert_rowid() - {kept};
+END;
+CREATE TRIGGER IF NOT EXISTS cache_removed AFTER DELETE ON cache BEGIN
+    INSERT INTO cache_changes (key) VALUES (old.key);
+    DELETE FROM cache_changes WHERE id = last_insert_rowid() - {kept};
+END;
+COMMIT;
+"""
+UPSERT = (
+    'INSERT INTO cache (key, value, expires, accessed, size) '
+    'VALUES (?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET '
+    'value = excluded.value, expires = excluded.expires, '
+    'accessed = excluded.accessed, size = excluded.size'
+)
+LIVE = '(expires IS NULL OR expires > ?)'
+# Время обращений записывается перед записью в кэш и в конце запроса,
+# если накопилось TOUCH_BATCH обращений или прошло TOUCH_INTERVAL секунд.
+# Из чтения - только если его накопилось TOUCH_LIMIT.
+TOUCH_BATCH = 100
+TOUCH_INTERVAL = 1.0
+TOUCH_LIMIT = 1000
+# Как часто горячие копии сверяются с журналом вне запросов.
+HOT_SYNC_INTERVAL = 1.0
+# Ограничение SQLite на число параметров запроса.
+CHUNK_SIZE = 500
+
+
+def chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class SQLiteCache(BaseCache):
+    """Кэш в файле LOCATION.
+
+    OPTIONS: MAX_ENTRIES и CULL_FREQUENCY как у встроенных кэшей,
+    MAX_BYTES - предел суммарного размера значений в байтах, TIMEOUT -
+    сколько секунд ждать блокировки файла.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._max_bytes = options.get('MAX_BYTES')
+        self._busy_timeout = options.get('TIMEOUT', 5)
+        self._local = threading.local()
+
+    def _connection(self):
+        # Соединение своё у каждого потока и не наследуется после fork.
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self._path, timeout=self._busy_timeout, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            # Страницы файла читаются через общую для процессов память.
+            connection.execute('PRAGMA mmap_size = 268435456')
+            connection.execute('PRAGMA journal_size_limit = 33554432')
+            connection.executescript(SCHEMA.format(kept=CHANGES_KEPT))
+            local.connection = connection
+            local.pid = os.getpid()
+            local.touched = {}
+            local.expired = set()
+            local.flushed = time.monotonic()
+            local.data_version = None
+        return local.connection
+
+    def _transaction(self):
+        return Transaction(self._connection())
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _row(self, key, value, timeout, now):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return key, data, self.get_backend_timeout(timeout), now, len(data)
+
+    def _touch(self, keys, now):
+        local = self._local
+        local.touched.update(dict.fromkeys(keys, now))
+        if len(local.touched) >= TOUCH_LIMIT:
+            # Чтение не ждёт чужой записи: если файл занят, время
+            # обращений запишется в следующий раз.
+            self._flush_touched(wait=False)
+
+    def _flush_touched(self, wait=True):
+        """Записывает время обращений и удаляет прочитанные истёкшие ключи.
+
+        Всё пишется одной транзакцией. Без wait блокировка файла не
+        ждётся: если файл занят, запись откладывается до следующего раза.
+        """
+        connection = self._connection()
+        local = self._local
+        local.flushed = time.monotonic()
+        if not local.touched and not local.expired:
+            return
+        now = time.time()
+        if not wait:
+            connection.execute('PRAGMA busy_timeout = 0')
+        try:
+            with Transaction(connection):
+                connection.executemany(
+                    'UPDATE cache SET accessed = ? WHERE key = ?',
+                    ((accessed, key)
+                     for key, accessed in local.touched.items())
+                )
+                connection.executemany(
+                    'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                    ((key, now) for key in local.expired)
+                )
+        except sqlite3.OperationalError:
+            if wait:
+                raise
+            return
+        finally:
+            if not wait:
+                connection.execute(
+                    f'PRAGMA busy_timeout = {self._busy_timeout * 1000:.0f}'
+                )
+        local.touched = {}
+        local.expired = set()
+
+    def _cull(self, connection, now):
+        """Вытесняет записи сверх MAX_ENTRIES и MAX_BYTES.
+
+        Сначала удаляются истёкшие записи, затем самые давно читанные,
+        пока не освободится 1/CULL_FREQUENCY лимита.
+        """
+        entries, size = connection.execute(
+            'SELECT entries, bytes FROM cache_size'
+        ).fetchone()
+        max_bytes = self._max_bytes
+        if entries <= self._max_entries and (
+            max_bytes is None or size <= max_bytes
+        ):
+            return
+        connection.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+        keep = 1 - 1 / self._cull_frequency if self._cull_frequency else 0
+        # Оконные суммы по записям от самой свежей: вытесняется всё, что
+        # не помещается в уменьшенные лимиты.
+        connection.execute(
+            'DELETE FROM cache WHERE key IN ('
+            ' SELECT key FROM ('
+            '  SELECT key, ROW_NUMBER() OVER newest AS number,'
+            '   SUM(size) OVER newest AS total FROM cache'
+            '  WINDOW newest AS (ORDER BY accessed DESC, key))'
+            ' WHERE number > ? OR total > ?)',
+            (
+                int(self._max_entries * keep),
+                None if max_bytes is None else int(max_bytes * keep),
+            )
+        )
+
+    def _write(self, rows, now):
+        # Нулевой или отрицательный таймаут означает удалить запись.
+        live = [row for row in rows if row[2] is None or row[2] > now]
+        dead = [(row[0],) for row in rows if row[2] is not None
+                and row[2] <= now]
+        # Время обращений пишется до вытеснения, чтобы оно его учло.
+        self._flush_touched()
+        with self._transaction() as connection:
+            connection.executemany(UPSERT, live)
+            connection.executemany('DELETE FROM cache WHERE key = ?', dead)
+            self._cull(connection, now)
+        self._changed([row[0] for row in rows])
+
+    def _changed(self, keys):
+        """Вызывается после записи ключей keys (None - всех) этим потоком."""
+
+    def _changes(self, since):
+        """Ключи, изменённые в файле после записи журнала since.
+
+        Возвращает номер последней записи журнала и ключи; ключи - None,
+        если журнал уже не помнит since. Пока в файл не писали другие
+        соединения, стоит одного PRAGMA data_version без чтения файла.
+        """
+        connection = self._connection()
+        local = self._local
+        version = connection.execute('PRAGMA data_version').fetchone()[0]
+        if since is not None and version == local.data_version:
+            return since, ()
+        local.data_version = version
+        first, last = connection.execute(
+            'SELECT MIN(id), MAX(id) FROM cache_changes'
+        ).fetchone()
+        if last is None or since is None:
+            return last or 0, None
+        if first > since + 1:
+            return last, None
+        return last, [key for key, in connection.execute(
+            'SELECT key FROM cache_changes WHERE id > ? AND id <= ?',
+            (since, last)
+        )]
+
+    def _select(self, keys, now):
+        """Живые записи keys: ключ -> (значение pickle, срок)."""
+        found = {}
+        expired = []
+        connection = self._connection()
+        for chunk in chunks(keys):
+            for key, data, expires in connection.execute(
+                'SELECT key, value, expires FROM cache WHERE key IN '
+                f'({", ".join("?" * len(chunk))})', chunk
+            ):
+                if expires is not None and expires <= now:
+                    expired.append(key)
+                else:
+                    found[key] = data, expires
+        self._local.expired.update(expired)
+        self._touch(found, now)
+        return found
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        found = self._select([key], time.time())
+        if key not in found:
+            return default
+        return pickle.loads(found[key][0])
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        return {
+            keys[key]: pickle.loads(data)
+            for key, (data, _) in self._select(keys, time.time()).items()
+        }
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return self._connection().execute(
+            f'SELECT 1 FROM cache WHERE key = ? AND {LIVE}', (key, time.time())
+        ).fetchone() is not None
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        self._write(
+            [self._row(self._key(key, version), value, timeout, now)], now
+        )
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        rows = [
+            self._row(self._key(key, version), value, timeout, now)
+            for key, value in data.items()
+        ]
+        if rows:
+            self._write(rows, now)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        row = self._row(self._key(key, version), value, timeout, now)
+        self._flush_touched()
+        with self._transaction() as connection:
+            added = connection.execute(
+                UPSERT + ' WHERE cache.expires <= ?', (*row, now)
+            ).rowcount
+            self._cull(connection, now)
+        self._changed([row[0]])
+        return bool(added)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as connection:
+            touched = connection.execute(
+                f'UPDATE cache SET expires = ?, accessed = ? '
+                f'WHERE key = ? AND {LIVE}',
+                (self.get_backend_timeout(timeout), now, key, now)
+            ).rowcount
+        self._changed([key])
+        return bool(touched)
+
+    def incr(self, key, delta=1, version=None):
+        """Атомарно прибавляет delta: запись захватывается до чтения."""
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as connection:
+            row = connection.execute(
+                f'SELECT value FROM cache WHERE key = ? AND {LIVE}',
+                (key, now)
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            connection.execute(
+                'UPDATE cache SET value = ?, size = ?, accessed = ? '
+                'WHERE key = ?', (data, len(data), now, key)
+            )
+        self._changed([key])
+        return value
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        connection = self._connection()
+        self._local.touched.pop(key, None)
+        deleted = connection.execute(
+            'DELETE FROM cache WHERE key = ?', (key,)
+        ).rowcount
+        self._changed([key])
+        return bool(deleted)
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        with self._transaction() as connection:
+            connection.executemany(
+                'DELETE FROM cache WHERE key = ?', ((key,) for key in keys)
+            )
+        self._changed(keys)
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+        self._local.touched = {}
+        self._local.expired = set()
+        self._changed(None)
+
+    def close(self, **kwargs):
+        # Django вызывает close в конце каждого запроса; соединение
+        # остаётся открытым.
+        local = self._local
+        if getattr(local, 'pid', None) == os.getpid() and (
+            len(local.touched) >= TOUCH_BATCH
+            or time.monotonic() - local.flushed >= TOUCH_INTERVAL
+        ):
+            self._flush_touched(wait=False)
+
+
+class HotTier:
+    """Горячие копии записей в памяти процесса, общие для его потоков.
+
+    Хранит значения в pickle, как они лежат в файле: вызывающий код не
+    может испортить копию, меняя полученный объект. Ограничена числом
+    записей, суммарным размером и временем жизни копии.
+    """
+
+    def __init__(self, max_entries, max_bytes, timeout):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.size = 0
+        # Номер последней записи журнала изменений, учтённой в копиях.
+        self.change_id = None
+        self.lock = threading.Lock()
+
+    def get(self, key, now):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                self._pop(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, data, expires, now, change_id):
+        """Запоминает копию, если журнал не сдвинулся с change_id.
+
+        Иначе значение могло быть прочитано до изменения, которое копии
+        уже не отменят.
+        """
+        if len(data) > self.max_bytes:
+            return
+        deadline = now + self.timeout
+        if expires is not None:
+            deadline = min(deadline, expires)
+        with self.lock:
+            if change_id != self.change_id:
+                return
+            self._pop(key)
+            self.entries[key] = data, deadline
+            self.size += len(data)
+            while (len(self.entries) > self.max_entries
+                   or self.size > self.max_bytes):
+                self._pop(next(iter(self.entries)))
+
+    def apply(self, change_id, keys):
+        """Отменяет копии keys (None - все) из журнала по change_id."""
+        with self.lock:
+            if keys is None:
+                self.entries.clear()
+                self.size = 0
+            for key in keys or ():
+                self._pop(key)
+            if self.change_id is None or change_id > self.change_id:
+                self.change_id = change_id
+            return self.change_id
+
+    def discard(self, keys):
+        with self.lock:
+            for key in keys:
+                self._pop(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+
+
+_hot_tiers = {}
+_hot_tiers_lock = threading.Lock()
+
+
+class HotCache(SQLiteCache):
+    """SQLiteCache с горячими копиями записей в памяти процесса.
+
+    Попадание в копию обходится без запроса к файлу и его чтения. Записи
+    других процессов отменяют копии через журнал cache_changes: в начале
+    запроса PRAGMA data_version показывает, менялся ли файл, и только
+    тогда журнал читается. Свои записи отменяют копии сразу.
+
+    OPTIONS, кроме опций SQLiteCache: HOT_MAX_ENTRIES, HOT_MAX_BYTES и
+    HOT_TIMEOUT - сколько секунд живёт копия.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(location, params)
+        options = params.get('OPTIONS', {})
+        with _hot_tiers_lock:
+            if location not in _hot_tiers:
+                _hot_tiers[location] = HotTier(
+                    options.get('HOT_MAX_ENTRIES', 300),
+                    options.get('HOT_MAX_BYTES', 16 * 1024 * 1024),
+                    options.get('HOT_TIMEOUT', 60),
+                )
+            self._hot = _hot_tiers[location]
+
+    def _sync(self):
+        """Отменяет копии ключей, изменённых другими соединениями.
+
+        Проверяет журнал один раз за запрос, а вне запросов - не чаще
+        раза в HOT_SYNC_INTERVAL секунд.
+        """
+        hot = self._hot
+        local = self._local
+        now = time.monotonic()
+        synced = getattr(local, 'synced', None)
+        if synced is not None and now - synced < HOT_SYNC_INTERVAL:
+            return hot.change_id
+        local.synced = now
+        since = hot.change_id
+        change_id, keys = self._changes(since)
+        if change_id == since and not keys:
+            return since
+        return hot.apply(change_id, keys)
+
+    def _select(self, keys, now):
+        change_id = self._sync()
+        found = {}
+        missing = []
+        for key in keys:
+            entry = self._hot.get(key, now)
+            if entry is None:
+                missing.append(key)
+            else:
+                found[key] = entry
+        # Чтобы горячие записи не вытеснялись из файла как давно читанные.
+        self._touch(found, now)
+        if missing:
+            fetched = super()._select(missing, now)
+            for key, (data, expires) in fetched.items():
+                self._hot.put(key, data, expires, now, change_id)
+            found.update(fetched)
+        return found
+
+    def _changed(self, keys):
+        if keys is None:
+            self._hot.clear()
+        else:
+            self._hot.discard(keys)
+
+    def close(self, **kwargs):
+        super().close(**kwargs)
+        self._local.synced = None
+
+
+class Transaction:
+    """BEGIN IMMEDIATE: блокировка на запись берётся до первого чтения."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.execute('ROLLBACK' if exc_type else 'COMMIT')
@@ -0,0 +1,60 @@
+"""Дырявое кэширование страниц.
+
+Страница рендерится и кэшируется в анонимном виде: вместо фрагментов,
+зависящих от пользователя (шапка, кнопка подписки, форма комментария с
+CSRF-токеном), в неё выводятся маркеры тегом {% hole %}. При каждом
+ответе маркеры заменяются фрагментами, отрендеренными для текущего
+запроса.
+"""
+import base64
+import json
+import re
+
+from django.template.loader import render_to_string
+
+MARKER = re.compile(r'<!--hole:([A-Za-z0-9_\-]+)-->')
+
+_providers = {}
+
+
+def provider(template_name):
+    """Регистрирует функцию, дополняющую контекст фрагмента.
+
+    Функция получает запрос и параметры тега hole и возвращает словарь.
+    """
+    def decorator(func):
+        _providers[template_name] = func
+        return func
+    return decorator
+
+
+def marker(template_name, params):
+    payload = json.dumps([template_name, params]).encode()
+    token = base64.urlsafe_b64encode(payload).decode().rstrip('=')
+    return f'<!--hole:{token}-->'
+
+
+def render_hole(request, template_name, params):
+    context = dict(params)
+    if template_name in _providers:
+        context.update(_providers[template_name](request, **params))
+    return render_to_string(template_name, context, request=request)
+
+
+def _render_marker(request, match):
+    token = match.group(1)
+    template_name, params = json.loads(
+        base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+    )
+    return render_hole(request, template_name, params)
+
+
+def fill(request, response):
+    """Подставляет в ответ фрагменты для текущего пользователя."""
+    if response.streaming or not response.content:
+        return response
+    content = response.content.decode(response.charset)
+    response.content = MARKER.sub(
+        lambda match: _render_marker(request, match), content
+    )
+    return response
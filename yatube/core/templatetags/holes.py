@@ -0,0 +1,19 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from core import holes
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, template_name, **params):
+    """Фрагмент, зависящий от пользователя.
+
+    На страницах с дырявым кэшированием выводит маркер, иначе сразу
+    рендерит фрагмент.
+    """
+    request = context.get('request')
+    if getattr(request, 'punch_holes', False):
+        return mark_safe(holes.marker(template_name, params))
+    return holes.render_hole(request, template_name, params)
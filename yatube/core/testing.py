@@ -0,0 +1,43 @@
+"""Окружение тестов: отдельный временный файл кэша.
+
+Тесты не должны получать страницы, закэшированные сервером по рабочей
+базе, и портить их своими.
+"""
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+@contextmanager
+def temporary_cache():
+    """Переносит файлы кэшей во временный каталог на время блока."""
+    directory = tempfile.mkdtemp(prefix='yatube-cache-')
+    caches = {
+        alias: dict(
+            options, LOCATION=os.path.join(directory, f'{alias}.sqlite3')
+        )
+        for alias, options in settings.CACHES.items()
+    }
+    try:
+        with override_settings(CACHES=caches):
+            yield
+    finally:
+        shutil.rmtree(directory, True)
+
+
+class TestRunner(DiscoverRunner):
+    """DiscoverRunner, запускающий тесты с temporary_cache."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache = temporary_cache()
+        self.cache.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)
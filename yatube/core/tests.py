@@ -1,7 +1,17 @@
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
 from http import HTTPStatus
 
+from django.conf import settings
+from django.core.cache import cache
 from django.test import TestCase
 
+from core.cache import HotCache, HotTier, SQLiteCache
+
 
 NONEXIST_URL = '/nonexist/'
 TEMPL_404 = 'core/404.html'
@@ -17,3 +27,185 @@ class ViewTestClass(TestCase):
         """Проверка  шаблона кастомной страницы 404."""
         response = self.client.get(NONEXIST_URL)
         self.assertTemplateUsed(response, TEMPL_404)
+
+
+def increment(path, times):
+    cache = SQLiteCache(path, {})
+    for _ in range(times):
+        cache.incr('counter')
+
+
+def write(path, key, value):
+    HotCache(path, {}).set(key, value)
+
+
+def remove(path, key):
+    HotCache(path, {}).delete(key)
+
+
+class SQLiteCacheTest(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        self.path = os.path.join(directory, 'cache.sqlite3')
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.path, {'OPTIONS': options})
+
+    def test_values_are_shared_between_instances(self):
+        """Записи одного экземпляра видны другому, как другому процессу."""
+        writer, reader = self.make_cache(), self.make_cache()
+        writer.set('page', {'html': 'текст'})
+        writer.set_many({'one': 1, 'two': [2]})
+        self.assertEqual(reader.get('page'), {'html': 'текст'})
+        self.assertEqual(
+            reader.get_many(['one', 'two', 'missing']),
+            {'one': 1, 'two': [2]}
+        )
+        reader.delete_many(['one', 'two'])
+        self.assertEqual(writer.get_many(['one', 'two']), {})
+        self.assertIsNone(writer.get('missing'))
+
+    def test_incr_is_atomic_across_processes(self):
+        cache = self.make_cache()
+        cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=increment, args=(self.path, 50))
+            for _ in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(cache.get('counter'), 200)
+        self.assertEqual(cache.incr('counter', 5), 205)
+        with self.assertRaises(ValueError):
+            cache.incr('missing')
+
+    def test_expired_entries(self):
+        cache = self.make_cache()
+        cache.set('gone', 1, 0)
+        self.assertFalse(cache.has_key('gone'))
+        cache.set('old', 1, 0.01)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('old'))
+        self.assertTrue(cache.add('old', 2))
+        self.assertFalse(cache.add('old', 3))
+        self.assertEqual(cache.get('old'), 2)
+
+    def test_reads_do_not_wait_for_write_lock(self):
+        """Чтение истёкшей записи не пишет в занятый файл."""
+        cache = self.make_cache(TIMEOUT=1)
+        cache.set('fresh', 1)
+        cache.set('old', 1, 0.01)
+        time.sleep(0.02)
+        other = sqlite3.connect(self.path, isolation_level=None)
+        self.addCleanup(other.close)
+        other.execute('BEGIN IMMEDIATE')
+        start = time.monotonic()
+        self.assertIsNone(cache.get('old'))
+        self.assertEqual(cache.get('fresh'), 1)
+        cache.close()
+        self.assertLess(time.monotonic() - start, 0.5)
+        other.execute('COMMIT')
+        cache._flush_touched()
+        self.assertEqual(other.execute(
+            'SELECT key FROM cache'
+        ).fetchall(), [(':1:fresh',)])
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = self.make_cache(MAX_ENTRIES=10, CULL_FREQUENCY=2)
+        for number in range(10):
+            cache.set(f'key{number}', number)
+        cache.get('key0')
+        cache.set('key10', 10)
+        self.assertEqual(cache.get('key0'), 0)
+        self.assertEqual(cache.get('key10'), 10)
+        self.assertIsNone(cache.get('key1'))
+        self.assertEqual(len(cache.get_many(
+            f'key{number}' for number in range(11)
+        )), 5)
+
+    def test_size_limit(self):
+        cache = self.make_cache(MAX_BYTES=10000, CULL_FREQUENCY=2)
+        for number in range(4):
+            cache.set(f'key{number}', b'x' * 3000)
+        self.assertEqual(
+            list(cache.get_many(f'key{number}' for number in range(4))),
+            ['key3']
+        )
+
+
+class HotCacheTest(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        self.path = os.path.join(directory, 'cache.sqlite3')
+        self.cache = HotCache(self.path, {})
+
+    def in_other_process(self, func, *args):
+        process = multiprocessing.get_context('fork').Process(
+            target=func, args=(self.path, *args)
+        )
+        process.start()
+        process.join()
+
+    def test_hot_hit_does_not_read_file(self):
+        self.cache.set_many({'page': 'страница', 'version': 1})
+        self.cache.get_many(['page', 'version'])
+        self.cache.close()
+        statements = []
+        self.cache._connection().set_trace_callback(statements.append)
+        self.assertEqual(
+            self.cache.get_many(['page', 'version']),
+            {'page': 'страница', 'version': 1}
+        )
+        self.assertEqual(self.cache.get('page'), 'страница')
+        # Журнал сверяется один раз за запрос.
+        self.assertEqual(statements, ['PRAGMA data_version'])
+
+    def test_write_in_other_process_evicts_hot_copy(self):
+        self.cache.set('page', 'старая')
+        self.assertEqual(self.cache.get('page'), 'старая')
+        self.in_other_process(write, 'page', 'новая')
+        self.cache.close()
+        self.assertEqual(self.cache.get('page'), 'новая')
+        self.in_other_process(remove, 'page')
+        self.cache.close()
+        self.assertIsNone(self.cache.get('page'))
+
+    def test_own_writes_evict_hot_copy(self):
+        self.cache.set('counter', 1)
+        self.cache.get('counter')
+        self.assertEqual(self.cache.incr('counter'), 2)
+        self.assertEqual(self.cache.get('counter'), 2)
+        self.cache.delete('counter')
+        self.assertIsNone(self.cache.get('counter'))
+
+    def test_tier_limits(self):
+        tier = HotTier(max_entries=2, max_bytes=100, timeout=60)
+        tier.change_id = 0
+        for key in ('one', 'two', 'three'):
+            tier.put(key, b'x' * 10, None, 0, 0)
+        self.assertIsNone(tier.get('one', 0))
+        tier.put('big', b'x' * 101, None, 0, 0)
+        self.assertIsNone(tier.get('big', 0))
+        tier.put('short', b'x', 30, 0, 0)
+        self.assertIsNotNone(tier.get('short', 29))
+        self.assertIsNone(tier.get('short', 30))
+        # Значение, прочитанное до сдвига журнала, не запоминается.
+        tier.put('stale', b'x', None, 0, -1)
+        self.assertIsNone(tier.get('stale', 0))
+
+
+class TestRunnerTest(TestCase):
+    def test_cache_file_is_temporary(self):
+        """Тесты пишут кэш во временный файл, а не в файл сервера."""
+        cache.set('key', 'value')
+        self.assertFalse(
+            os.path.exists(os.path.join(settings.BASE_DIR, 'cache'))
+        )
+        self.assertFalse(settings.CACHES['default']['LOCATION'].startswith(
+            settings.BASE_DIR
+        ))
@@ -1,9 +1,93 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.db.models import Q
+from django.db.models.functions import Substr
+from django.http import StreamingHttpResponse
+from django.utils.text import Truncator
 
-from .models import Comment, Follow, Group, Post
+from . import exports, search
+from .forms import PostAdminForm
+from .models import Comment, Follow, Group, Post, User
+from .utils import ApproximatePaginator
 
+TEXT_PREVIEW_LENGTH = 80
 
-class PostAdmin(admin.ModelAdmin):
+
+def follows_of(queryset, username):
+    """Подписки пользователя и на пользователя с точным именем."""
+    users = User.objects.filter(username=username.strip()).values('pk')
+    return queryset.filter(Q(author__in=users) | Q(user__in=users))
+
+
+def export_csv(modeladmin, request, queryset):
+    """Отдаёт выбранные объекты в CSV, читая их из базы порциями."""
+    kind = exports.KINDS[queryset.model]
+    response = StreamingHttpResponse(
+        exports.csv_lines(kind, exports.rows(queryset)),
+        content_type='text/csv; charset=utf-8'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{kind}.csv"'
+    return response
+
+
+export_csv.short_description = 'Выгрузить в CSV'
+
+
+class SearchIndexMixin:
+    """Поиск в списке объектов по индексу, а не LIKE."""
+
+    search_index = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return self.search_index(queryset, search_term), False
+
+
+class ProjectedChangeList(ChangeList):
+    """Список объектов, выбирающий из базы только выводимые поля.
+
+    Поля truncated_fields выбираются не целиком, а началом длиной
+    TEXT_PREVIEW_LENGTH, которое и подставляется в объекты списка.
+    """
+
+    def get_queryset(self, request):
+        model_admin = self.model_admin
+        return super().get_queryset(request).only(
+            *model_admin.list_only
+        ).annotate(**{
+            f'{field}_start': Substr(field, 1, TEXT_PREVIEW_LENGTH + 1)
+            for field in model_admin.truncated_fields
+        })
+
+    def get_results(self, request):
+        super().get_results(request)
+        for obj in self.result_list:
+            for field in self.model_admin.truncated_fields:
+                setattr(obj, field, Truncator(
+                    getattr(obj, f'{field}_start')
+                ).chars(TEXT_PREVIEW_LENGTH))
+
+
+class LargeTableMixin:
+    """Список объектов большой таблицы без точного COUNT(*)."""
+
+    paginator = ApproximatePaginator
+    show_full_result_count = False
+    actions = (export_csv,)
+    list_only = ()
+    truncated_fields = ()
+
+    def get_changelist(self, request, **kwargs):
+        return ProjectedChangeList
+
+
+class PostAdmin(LargeTableMixin, SearchIndexMixin, admin.ModelAdmin):
+    search_index = staticmethod(search.matching_posts)
+    form = PostAdminForm
+    # Размеры и превью вычисляются при загрузке картинки.
+    readonly_fields = ('image_width', 'image_height')
+    exclude = ('image_placeholder',)
     list_display = (
         'pk',
         'text',
@@ -11,10 +95,16 @@ class PostAdmin(admin.ModelAdmin):
         'author',
         'group',
     )
+    list_select_related = ('author', 'group')
+    list_only = ('pub_date', 'author__username', 'group__title')
+    truncated_fields = ('text',)
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    # Даты для навигации берутся из DayStats, см. шаблон списка постов.
+    date_hierarchy = 'pub_date'
+    raw_id_fields = ('author',)
+    autocomplete_fields = ('group',)
     empty_value_display = '-пусто-'
-    list_editable = ('group',)
 
 
 class GroupAdmin(admin.ModelAdmin):
@@ -23,25 +113,39 @@ class GroupAdmin(admin.ModelAdmin):
         'slug',
         'description',
     )
-    search_fields = ('text',)
+    search_fields = ('title', 'slug')
     empty_value_display = '-пусто-'
     prepopulated_fields = {'slug': ('title',)}
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(LargeTableMixin, SearchIndexMixin, admin.ModelAdmin):
+    search_index = staticmethod(search.matching_comments)
     list_display = (
         'author',
         'text',
         'created',
-        'post'
+        'post_number',
     )
+    list_select_related = ('author',)
+    list_only = ('created', 'post_id', 'author__username')
+    truncated_fields = ('text',)
     search_fields = ('text',)
+    raw_id_fields = ('author', 'post')
     empty_value_display = '-пусто-'
 
+    def post_number(self, comment):
+        return comment.post_id
+    post_number.short_description = 'Пост'
+    post_number.admin_order_field = 'post'
+
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(LargeTableMixin, SearchIndexMixin, admin.ModelAdmin):
+    search_index = staticmethod(follows_of)
     list_display = ('author', 'user',)
-    search_fields = ('author',)
+    list_select_related = ('author', 'user')
+    list_only = ('author__username', 'user__username')
+    search_fields = ('author__username', 'user__username')
+    raw_id_fields = ('author', 'user')
     empty_value_display = '-пусто-'
 
 
@@ -0,0 +1,414 @@
+"""Кэш страниц лент с версионированными ключами.
+
+Для каждой области (все посты, группа, автор) в кэше хранится счётчик
+поколения. Ключ страницы собирается из поколений областей, от которых она
+зависит, поэтому запись в область сразу делает старые страницы
+недостижимыми, а сами страницы могут жить в кэше часами. Из тех же
+поколений и времени последней записи строятся ETag и Last-Modified.
+
+После записи в область все процессы одновременно промахиваются мимо
+нового ключа страницы, поэтому страницы строятся через fetch: одна
+перестройка на ключ во всех процессах, остальные запросы ждут её. Если
+база при этом не отвечает, отдаётся последняя удачная копия страницы.
+"""
+import hashlib
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import partial, wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from core import holes
+
+from . import degraded
+
+POSTS = 'posts'
+GROUPS = 'groups'
+USERS = 'users'
+GROUP = 'group:{slug}'
+AUTHOR = 'author:{username}'
+POST = 'post:{post_id}'
+FOLLOWING = 'following:{user_id}'
+
+# Перестройка страниц, см. fetch. Блокировка перестройки живёт не дольше
+# REBUILD_LOCK_TIMEOUT секунд на случай, если её владелец упал.
+REBUILD_LOCK_TIMEOUT = 30
+REBUILD_WAIT = 5
+REBUILD_POLL = 0.02
+XFETCH_BETA = 1.0
+# События перестройки: rebuilds - страница построена; early_rebuilds - из
+# них построены заранее, до истечения срока; coalesced - запрос дождался
+# перестройки в своём процессе, waited - в другом; stale - запрос получил
+# старую страницу, пока её заранее перестраивал другой.
+STAMPEDE_EVENTS = (
+    'rebuilds', 'early_rebuilds', 'coalesced', 'waited', 'stale'
+)
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def _generation_key(scope):
+    # Слаги и имена пользователей могут содержать символы, недопустимые
+    # в ключах memcached.
+    return 'generation:' + hashlib.md5(scope.encode()).hexdigest()
+
+
+def _modified_key(scope):
+    return 'modified:' + hashlib.md5(scope.encode()).hexdigest()
+
+
+def _values(keys, default):
+    found = cache.get_many(keys)
+    return [
+        found[key] if key in found else cache.get_or_set(key, default, None)
+        for key in keys
+    ]
+
+
+def generations(scopes):
+    """Текущие поколения областей.
+
+    Пропавший из кэша счётчик заводится заново от текущего времени, чтобы
+    не совпасть с поколением уже закэшированных страниц.
+    """
+    return _values([_generation_key(scope) for scope in scopes], time.time_ns)
+
+
+def last_modified(scopes):
+    """Время последней записи в области.
+
+    Если отметка пропала из кэша, запись считается сделанной сейчас.
+    """
+    stamps = _values([_modified_key(scope) for scope in scopes], time.time)
+    return datetime.fromtimestamp(max(stamps), timezone.utc)
+
+
+def bump(*scopes):
+    """Начинает новое поколение для каждой из областей."""
+    for scope in set(scopes):
+        key = _generation_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+    now = time.time()
+    cache.set_many({_modified_key(scope): now for scope in scopes}, None)
+
+
+def bump_on_commit(*scopes):
+    """Начинает новые поколения сейчас и ещё раз после фиксации транзакции.
+
+    Запрос, прочитавший базу до фиксации, сохраняет старую страницу под
+    поколением, начатым внутри транзакции. Второе поколение её отбрасывает.
+    """
+    bump(*scopes)
+    transaction.on_commit(partial(bump, *scopes))
+
+
+def _path_hash(request):
+    return hashlib.md5(request.get_full_path().encode()).hexdigest()
+
+
+def page_key(request, scopes):
+    versions = '.'.join(str(generation) for generation in generations(scopes))
+    return f'page:{versions}:{_path_hash(request)}'
+
+
+def stale_key(request):
+    """Ключ последней удачно построенной копии страницы любого поколения."""
+    return f'stale:{_path_hash(request)}'
+
+
+def _count(event):
+    key = f'stampede:{event}'
+    if not cache.add(key, 1, None):
+        cache.incr(key)
+
+
+def stampede_stats():
+    """Число событий перестройки страниц во всех процессах."""
+    keys = {f'stampede:{event}': event for event in STAMPEDE_EVENTS}
+    found = cache.get_many(keys)
+    return {event: found.get(key, 0) for key, event in keys.items()}
+
+
+def _lock_key(key):
+    return f'rebuild:{key}'
+
+
+def _rebuild_is_due(delta, expires):
+    """XFetch: перестроить ли заранее страницу, которая строилась delta.
+
+    Вероятность растёт по мере приближения срока и тем раньше, чем
+    дольше строится страница, так что перестройку успевает начать один
+    запрос задолго до того, как страница пропадёт из кэша у всех.
+    """
+    jitter = -delta * XFETCH_BETA * math.log(1 - random.random())
+    return time.time() + jitter >= expires
+
+
+class RebuildTimeout(Exception):
+    """Чужая перестройка не закончилась за отведённое время."""
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+
+@contextmanager
+def _single_flight(key, deadline):
+    """Перестройка key первым потоком процесса.
+
+    Первому потоку отдаёт None, остальным - его перестройку, дождавшись
+    её до deadline. Исключение первого потока остаётся в error.
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+    if not leader:
+        flight.done.wait(max(0, deadline - time.monotonic()))
+        yield flight
+        return
+    try:
+        yield None
+    except Exception as error:
+        flight.error = error
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+def _build(key, build, timeout, cacheable, locked):
+    start = time.monotonic()
+    try:
+        value = build()
+        if cacheable(value):
+            entry = (value, time.monotonic() - start, time.time() + timeout)
+            cache.set(key, entry, timeout)
+    finally:
+        if locked:
+            cache.delete(_lock_key(key))
+    _count('rebuilds')
+    return value
+
+
+def _build_after_miss(key, build, timeout, cacheable, deadline, late_build):
+    while not cache.add(_lock_key(key), True, REBUILD_LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            if not late_build:
+                raise RebuildTimeout(key)
+            # Владелец блокировки завис: строим сами, не дожидаясь её.
+            return _build(key, build, timeout, cacheable, locked=False)
+        time.sleep(REBUILD_POLL)
+        entry = cache.get(key)
+        if entry is not None:
+            _count('waited')
+            return entry[0]
+    # Страницу могли построить между промахом и захватом блокировки.
+    entry = cache.get(key)
+    if entry is not None:
+        cache.delete(_lock_key(key))
+        _count('waited')
+        return entry[0]
+    return _build(key, build, timeout, cacheable, locked=True)
+
+
+def fetch(key, build, timeout, cacheable=bool, errors=(),
+          wait=REBUILD_WAIT, late_build=True):
+    """Значение из кэша; при промахе строит его build() один раз.
+
+    Потоки одного процесса ждут перестройки у первого из них, процессы -
+    у того, кто взял блокировку ключа в общем кэше. Незадолго до срока
+    страница перестраивается заранее одним запросом (XFetch), а остальные
+    тем временем получают старую, её же получает и сам запрос, если
+    заранее перестроить не удалось из-за исключения из errors. В кэш
+    кладутся только значения, для которых cacheable истинно.
+
+    Чужую перестройку запрос ждёт не дольше wait секунд, а затем строит
+    значение сам или, если late_build ложно, выбрасывает RebuildTimeout.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        value, delta, expires = entry
+        if not _rebuild_is_due(delta, expires):
+            return value
+        if not cache.add(_lock_key(key), True, REBUILD_LOCK_TIMEOUT):
+            _count('stale')
+            return value
+        _count('early_rebuilds')
+        try:
+            return _build(key, build, timeout, cacheable, locked=True)
+        except errors:
+            return value
+    deadline = time.monotonic() + wait
+    with _single_flight(key, deadline) as flight:
+        if flight is not None:
+            entry = cache.get(key)
+            if entry is not None:
+                _count('coalesced')
+                return entry[0]
+            # Ошибку из errors повторять незачем: она скорее всего та же.
+            if isinstance(flight.error, errors):
+                raise flight.error
+        return _build_after_miss(
+            key, build, timeout, cacheable, deadline, late_build
+        )
+
+
+def _cacheable_response(response):
+    return response.status_code == 200 and not response.streaming
+
+
+DEGRADED_ERRORS = (DatabaseError, degraded.CircuitOpen, RebuildTimeout)
+
+
+def stale_response(request):
+    """Последняя удачная копия страницы с заголовками Age и Warning.
+
+    Если копии нет, отвечает 503 без шаблона: шаблоны с шапкой сами
+    обращаются к базе.
+    """
+    entry = cache.get(stale_key(request))
+    if entry is None:
+        response = HttpResponse(
+            'Сервис временно недоступен, попробуйте позже.',
+            content_type='text/plain; charset=utf-8', status=503
+        )
+        response['Retry-After'] = math.ceil(
+            degraded.feed_breaker.retry_in()
+        ) or 1
+        return response
+    response, built = entry
+    response['Age'] = int(time.time() - built)
+    response['Warning'] = '110 - "Response is Stale"'
+    return response
+
+
+def cache_feed(*scopes):
+    """Кэширует страницу под ключом из поколений областей.
+
+    Области задаются строками формата, в которые подставляются
+    именованные аргументы view, например 'group:{slug}'. Страница
+    рендерится и хранится одна на всех пользователей: фрагменты,
+    зависящие от пользователя, подставляются в ответ через core.holes.
+
+    Страница строится через fetch, запросы к базе при этом ограничены
+    бюджетом FEED_DB_BUDGET и предохранителем degraded.feed_breaker.
+    Удачная страница запоминается ещё и под stale_key. Если база не
+    ответила, отдаётся эта копия, а новая строится в фоне.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, **kwargs)
+            request.punch_holes = True
+            key = page_key(
+                request, [scope.format(**kwargs) for scope in scopes]
+            )
+
+            def build():
+                with degraded.feed_breaker.call(), degraded.db_budget(
+                    settings.FEED_DB_BUDGET
+                ):
+                    response = view(request, **kwargs)
+                if _cacheable_response(response):
+                    cache.set(
+                        stale_key(request), (response, time.time()),
+                        settings.STALE_PAGE_TIMEOUT
+                    )
+                return response
+
+            def rebuild():
+                # Ждать чужую перестройку дольше бюджета бессмысленно:
+                # сама она к этому времени упрётся в бюджет.
+                return fetch(
+                    key, build, settings.FEED_CACHE_TIMEOUT,
+                    _cacheable_response, DEGRADED_ERRORS,
+                    wait=settings.FEED_DB_BUDGET, late_build=False
+                )
+
+            try:
+                response = rebuild()
+            except DEGRADED_ERRORS:
+                degraded.refresh_later(key, rebuild)
+                response = stale_response(request)
+                if response.status_code != 200:
+                    return response
+            return holes.fill(request, response)
+        return wrapper
+    return decorator
+
+
+def strip_stale_validators(response):
+    """Убирает ETag и Last-Modified из старой копии и отказа.
+
+    Иначе они получили бы валидаторы текущего поколения, и клиент
+    закрепил бы их ответом 304. Сам ответ 304 обязан их повторить
+    (RFC 7232, 4.1).
+    """
+    if response.has_header('Warning') or (
+        response.status_code not in (200, 304)
+    ):
+        for header in ('ETag', 'Last-Modified'):
+            if response.has_header(header):
+                del response[header]
+    return response
+
+
+def conditional_page(*scopes):
+    """Отвечает 304, если страница не менялась с прошлого запроса.
+
+    ETag складывается из поколений областей и того, от чего зависят
+    фрагменты core.holes: пользователя и CSRF-куки. Last-Modified - время
+    последней записи в области. В областях, кроме аргументов view,
+    доступен user_id текущего пользователя. Запросов к базе проверка не
+    делает, кроме загрузки пользователя сессии.
+    """
+    def format_scopes(request, kwargs):
+        return [
+            scope.format(user_id=request.user.pk, **kwargs)
+            for scope in scopes
+        ]
+
+    def etag(request, **kwargs):
+        parts = (
+            request.user.pk,
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME),
+            *generations(format_scopes(request, kwargs)),
+        )
+        return hashlib.md5(repr(parts).encode()).hexdigest()
+
+    def modified(request, **kwargs):
+        return last_modified(format_scopes(request, kwargs))
+
+    def decorator(view):
+        conditional_view = condition(
+            etag_func=etag, last_modified_func=modified
+        )(view)
+
+        @wraps(view)
+        def wrapper(request, **kwargs):
+            response = conditional_view(request, **kwargs)
+            # Без явного запрета браузер может по эвристике показать
+            # страницу из своего кэша, не спросив сервер.
+            patch_cache_control(response, no_cache=True)
+            return strip_stale_validators(response)
+        return wrapper
+    return decorator
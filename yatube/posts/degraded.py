@@ -0,0 +1,136 @@
+"""Работа лент, когда база отвечает медленно или заблокирована.
+
+Пока длинная транзакция держит SQLite, запросы лент ждут блокировку и
+падают с database is locked. Сборка страницы получает бюджет времени на
+запросы к базе, ошибки считает предохранитель, а вместо ошибки
+отдаётся последняя удачная копия страницы, см. caching.cache_feed.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DatabaseError, OperationalError, connection, connections
+
+# Как часто SQLite проверяет бюджет, в инструкциях виртуальной машины.
+PROGRESS_STEPS = 10000
+
+
+class CircuitOpen(Exception):
+    """Предохранитель разомкнут: к базе сейчас не обращаемся."""
+
+
+class CircuitBreaker:
+    """Предохранитель обращений к базе, свой в каждом процессе.
+
+    После failures ошибок подряд размыкается и cooldown секунд сразу
+    отвечает CircuitOpen. Затем пропускает один пробный вызов: удачный
+    замыкает предохранитель, неудачный размыкает снова.
+    """
+
+    def __init__(self, failures, cooldown):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.errors = 0
+        self.opened_at = None
+        self.probing = False
+
+    def retry_in(self):
+        """Через сколько секунд будет пропущен пробный вызов."""
+        if self.opened_at is None:
+            return 0
+        return max(0, self.opened_at + self.cooldown - time.monotonic())
+
+    @contextmanager
+    def call(self):
+        with self.lock:
+            probe = self.opened_at is not None
+            if probe and (self.probing or self.retry_in() > 0):
+                raise CircuitOpen
+            self.probing = probe
+        try:
+            yield
+        except DatabaseError:
+            with self.lock:
+                self.errors += 1
+                if probe or self.errors >= self.failures:
+                    self.opened_at = time.monotonic()
+            raise
+        finally:
+            with self.lock:
+                self.probing = False
+        with self.lock:
+            self.reset()
+
+
+feed_breaker = CircuitBreaker(
+    settings.FEED_BREAKER_FAILURES, settings.FEED_BREAKER_COOLDOWN
+)
+
+
+@contextmanager
+def db_budget(seconds):
+    """Обрывает запросы к базе, не уложившиеся вместе в seconds секунд.
+
+    Для SQLite перед каждым запросом время ожидания блокировки урезается
+    до остатка бюджета, а выполняющийся запрос прерывается progress
+    handler. В обоих случаях выбрасывается OperationalError.
+    """
+    if connection.vendor != 'sqlite':
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    connection.ensure_connection()
+    raw = connection.connection
+    busy_timeout = raw.execute('PRAGMA busy_timeout').fetchone()[0]
+
+    def limit(execute, sql, params, many, context):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise OperationalError('database query budget exceeded')
+        raw.execute(f'PRAGMA busy_timeout = {remaining * 1000:.0f}')
+        return execute(sql, params, many, context)
+
+    raw.set_progress_handler(
+        lambda: time.monotonic() > deadline, PROGRESS_STEPS
+    )
+    try:
+        with connection.execute_wrapper(limit):
+            yield
+    finally:
+        raw.set_progress_handler(None, PROGRESS_STEPS)
+        raw.execute(f'PRAGMA busy_timeout = {busy_timeout}')
+
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def _refresh(key, rebuild, breaker):
+    try:
+        time.sleep(breaker.retry_in())
+        rebuild()
+    except (DatabaseError, CircuitOpen):
+        pass
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(key)
+        connections.close_all()
+
+
+def refresh_later(key, rebuild, breaker=feed_breaker):
+    """Вызывает rebuild в фоне, когда предохранитель пропустит запрос.
+
+    Для каждого key в процессе работает не больше одного потока.
+    """
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+    threading.Thread(
+        target=_refresh, args=(key, rebuild, breaker), daemon=True
+    ).start()
@@ -0,0 +1,119 @@
+"""Потоковая выгрузка данных в JSON Lines и CSV.
+
+Строки читаются из базы курсором порциями и сразу пишутся в вывод,
+поэтому выгрузка не держит таблицу в памяти. Поля совпадают с форматом
+команды import_yatube. CSV предназначен для таблиц, поэтому текст,
+который таблица приняла бы за формулу, в нём начинается с апострофа.
+"""
+import csv
+import gzip
+import json
+from datetime import datetime
+
+from .models import Comment, Follow, Group, Post
+
+FIELDS = {
+    'group': ('slug', 'title', 'description'),
+    'post': ('id', 'author', 'text', 'group', 'pub_date', 'image'),
+    'comment': ('id', 'post', 'author', 'text', 'created'),
+    'follow': ('user', 'author'),
+}
+LOOKUPS = {
+    'group': ('slug', 'title', 'description'),
+    'post': ('pk', 'author__username', 'text', 'group__slug', 'pub_date',
+             'image'),
+    'comment': ('pk', 'post_id', 'author__username', 'text', 'created'),
+    'follow': ('user__username', 'author__username'),
+}
+# Начала ячеек, с которых таблицы читают формулу.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+MODELS = {'group': Group, 'post': Post, 'comment': Comment, 'follow': Follow}
+KINDS = {model: kind for kind, model in MODELS.items()}
+
+
+def rows(queryset, chunk_size=2000):
+    """Кортежи полей FIELDS для объектов queryset в порядке pk."""
+    lookups = LOOKUPS[KINDS[queryset.model]]
+    for row in queryset.order_by('pk').values_list(*lookups).iterator(
+        chunk_size
+    ):
+        yield tuple(
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in row
+        )
+
+
+def jsonl_lines(kind, rows):
+    fields = FIELDS[kind]
+    for row in rows:
+        yield json.dumps(
+            {'type': kind, **dict(zip(fields, row))}, ensure_ascii=False
+        ) + '\n'
+
+
+class Echo:
+    """Файл для csv.writer, который возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def spreadsheet_safe(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_lines(kind, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(FIELDS[kind])
+    for row in rows:
+        yield writer.writerow([spreadsheet_safe(value) for value in row])
+
+
+LINES = {'jsonl': jsonl_lines, 'csv': csv_lines}
+
+
+def ranges(queryset, part_size):
+    """Диапазоны pk (first, last) по part_size строк.
+
+    Граница каждого диапазона ищется по индексу первичного ключа от
+    начала предыдущего; last последнего диапазона - None.
+    """
+    keys = queryset.order_by('pk').values_list('pk', flat=True)
+    first = keys.first()
+    while first is not None:
+        bounds = list(keys.filter(pk__gte=first)[part_size - 1:part_size + 1])
+        if not bounds:
+            yield first, None
+            return
+        yield first, bounds[0]
+        first = bounds[1] if len(bounds) > 1 else None
+
+
+def open_output(path, compress):
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def export_part(kind, first, last, path, output_format, compress,
+                chunk_size):
+    """Пишет в файл path строки kind с pk от first до last.
+
+    Возвращает число строк. Вызывается и в процессах пула.
+    """
+    queryset = MODELS[kind].objects.filter(pk__gte=first)
+    if last is not None:
+        queryset = queryset.filter(pk__lte=last)
+    written = 0
+
+    def counted():
+        nonlocal written
+        for row in rows(queryset, chunk_size):
+            written += 1
+            yield row
+
+    with open_output(path, compress) as output:
+        output.writelines(LINES[output_format](kind, counted()))
+    return written
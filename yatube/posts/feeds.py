@@ -0,0 +1,154 @@
+"""RSS и Atom ленты постов: общая, группы и автора.
+
+Ленты отдаются с ETag и Last-Modified, поэтому опрос ленты, в которой
+ничего не изменилось, получает 304 без запросов к базе и рендеринга.
+"""
+import hashlib
+
+from django.contrib.syndication.views import Feed
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.text import Truncator
+from django.views.decorators.http import condition
+
+from . import caching
+from .caching import cache_feed
+from .models import Group, Post, User
+
+FEED_ITEMS = 20
+
+
+def conditional_feed(*scopes):
+    """Кэширует ленту как cache_feed и отвечает 304 на неизменную.
+
+    ETag - поколения областей кэша, Last-Modified - время последней
+    записи в них, как в caching.conditional_page. Проверка не обращается
+    к базе, поэтому работает, и когда база заблокирована.
+    """
+    def format_scopes(kwargs):
+        return [scope.format(**kwargs) for scope in scopes]
+
+    def etag(request, **kwargs):
+        versions = caching.generations(format_scopes(kwargs))
+        return hashlib.md5(repr(versions).encode()).hexdigest()
+
+    def modified(request, **kwargs):
+        return caching.last_modified(format_scopes(kwargs))
+
+    def decorator(feed):
+        conditional_view = condition(
+            etag_func=etag, last_modified_func=modified
+        )(cache_feed(*scopes)(feed))
+
+        def view(request, **kwargs):
+            return caching.strip_stale_validators(
+                conditional_view(request, **kwargs)
+            )
+        return view
+    return decorator
+
+
+class PostsFeed(Feed):
+    title = 'Yatube'
+    description = 'Последние обновления на сайте'
+
+    def link(self):
+        return reverse('posts:index')
+
+    def items(self):
+        return Post.objects.select_related('author', 'group').order_by(
+            '-pub_date', '-pk'
+        )[:FEED_ITEMS]
+
+    def item_title(self, post):
+        return Truncator(post.text).chars(60)
+
+    def item_description(self, post):
+        return post.text
+
+    def item_link(self, post):
+        return reverse('posts:post_detail', args=(post.pk,))
+
+    def item_pubdate(self, post):
+        return post.pub_date
+
+    def item_updateddate(self, post):
+        return post.updated
+
+    def item_author_name(self, post):
+        return post.author.get_full_name() or post.author.username
+
+    def item_categories(self, post):
+        return (post.group.title,) if post.group else ()
+
+
+class GroupFeed(PostsFeed):
+    def get_object(self, request, slug):
+        return get_object_or_404(Group, slug=slug)
+
+    def title(self, group):
+        return f'Yatube: {group.title}'
+
+    def description(self, group):
+        return group.description
+
+    def link(self, group):
+        return reverse('posts:group_list', args=(group.slug,))
+
+    def items(self, group):
+        return group.posts.select_related('author', 'group').order_by(
+            '-pub_date', '-pk'
+        )[:FEED_ITEMS]
+
+
+class AuthorFeed(PostsFeed):
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username)
+
+    def title(self, author):
+        return f'Yatube: {author.get_full_name() or author.username}'
+
+    def description(self, author):
+        return f'Посты пользователя {author.username}'
+
+    def link(self, author):
+        return reverse('posts:profile', args=(author.username,))
+
+    def items(self, author):
+        return author.posts.select_related('author', 'group').order_by(
+            '-pub_date', '-pk'
+        )[:FEED_ITEMS]
+
+
+class AtomPostsFeed(PostsFeed):
+    feed_type = Atom1Feed
+    subtitle = PostsFeed.description
+
+
+class AtomGroupFeed(GroupFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, group):
+        return group.description
+
+
+class AtomAuthorFeed(AuthorFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, author):
+        return self.description(author)
+
+
+posts_rss = conditional_feed(
+    caching.POSTS, caching.GROUPS, caching.USERS
+)(PostsFeed())
+posts_atom = conditional_feed(
+    caching.POSTS, caching.GROUPS, caching.USERS
+)(AtomPostsFeed())
+group_rss = conditional_feed(caching.GROUP, caching.USERS)(GroupFeed())
+group_atom = conditional_feed(caching.GROUP, caching.USERS)(AtomGroupFeed())
+author_rss = conditional_feed(caching.AUTHOR, caching.GROUPS)(AuthorFeed())
+author_atom = conditional_feed(
+    caching.AUTHOR, caching.GROUPS
+)(AtomAuthorFeed())
@@ -1,5 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
+from . import images
 from .models import Comment, Post
 
 
@@ -8,6 +10,25 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        if isinstance(image, UploadedFile):
+            image, fields = images.normalize(image)
+        elif not image:
+            fields = images.NO_IMAGE
+        else:
+            return image
+        for name, value in fields.items():
+            setattr(self.instance, name, value)
+        return image
+
+
+class PostAdminForm(PostForm):
+    """Форма поста в админке: все поля, включая автора."""
+
+    class Meta(PostForm.Meta):
+        fields = '__all__'
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
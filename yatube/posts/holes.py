@@ -0,0 +1,27 @@
+from core.holes import provider
+
+from .forms import CommentForm
+from .models import AuthorStats, Follow
+
+
+@provider('includes/follow_button.html')
+def follow_button(request, author_id, username):
+    return {
+        'following': request.user.is_authenticated and Follow.objects.filter(
+            user=request.user.id, author_id=author_id
+        ).exists()
+    }
+
+
+@provider('includes/comment_form.html')
+def comment_form(request, post_id):
+    return {'form': CommentForm()}
+
+
+@provider('includes/author_posts_count.html')
+def author_posts_count(request, author_id):
+    return {
+        'posts_count': AuthorStats.objects.filter(
+            user_id=author_id
+        ).values_list('posts_count', flat=True).first()
+    }
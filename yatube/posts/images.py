@@ -0,0 +1,169 @@
+"""Обработка картинок постов при загрузке.
+
+Оригинал уменьшается до IMAGE_MAX_SIDE по большей стороне и
+перекодируется без EXIF: непрозрачные картинки в прогрессивный JPEG,
+с прозрачностью в WebP. JPEG декодируется в режиме draft, сразу в
+уменьшенном масштабе, поэтому память на загрузку не зависит от
+разрешения камеры. GIF сохраняются как есть, чтобы не потерять анимацию.
+
+Заодно вычисляются размеры картинки и крошечное превью для заглушки,
+которые хранятся в полях поста.
+"""
+import base64
+import math
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+PLACEHOLDER_SIDE = 16
+NO_IMAGE = {'image_width': None, 'image_height': None, 'image_placeholder': ''}
+
+# Значения EXIF Orientation, при которых картинка повёрнута на 90°.
+ROTATED = (5, 6, 7, 8)
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or (
+        image.mode == 'P' and 'transparency' in image.info
+    )
+
+
+def draft(image, scale):
+    """Включает для JPEG декодирование сразу в уменьшенном масштабе."""
+    if scale < 1:
+        # draft выбирает масштаб по обеим сторонам, поэтому передаётся
+        # итоговый размер, а не квадрат.
+        image.draft('RGB', (
+            math.ceil(image.width * scale),
+            math.ceil(image.height * scale)
+        ))
+
+
+def fit(size, box):
+    """Размер картинки size, вписанной в рамку box с увеличением."""
+    width, height = size
+    scale = min(box[0] / width, box[1] / height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def placeholder(image):
+    """data: URI копии картинки размером PLACEHOLDER_SIDE по большей стороне.
+
+    Растянутая браузером, она выглядит как размытое превью и весит
+    несколько сотен байт.
+    """
+    preview = image.convert('RGBA' if has_alpha(image) else 'RGB')
+    preview.thumbnail((PLACEHOLDER_SIDE, PLACEHOLDER_SIDE), Image.BOX)
+    output = BytesIO()
+    preview.save(output, 'WEBP', quality=30)
+    return 'data:image/webp;base64,' + base64.b64encode(
+        output.getvalue()
+    ).decode()
+
+
+def describe_stored(name):
+    """Значения полей поста для сохранённой картинки, None без файла.
+
+    Выполняется в процессах команды backfill_images.
+    """
+    try:
+        with default_storage.open(name) as stored, \
+                Image.open(stored) as image:
+            width, height = image.size
+            if image.getexif().get(0x0112) in ROTATED:
+                width, height = height, width
+            draft(image, PLACEHOLDER_SIDE / max(image.size))
+            preview = placeholder(ImageOps.exif_transpose(image))
+    except (OSError, Image.DecompressionBombError):
+        return None
+    return {
+        'image_width': width,
+        'image_height': height,
+        'image_placeholder': preview,
+    }
+
+
+def derivative(name, box, image_format):
+    """Копия сохранённой картинки, вписанная в рамку box, в байтах."""
+    with default_storage.open(name) as stored, Image.open(stored) as source:
+        size = source.size
+        if source.getexif().get(0x0112) in ROTATED:
+            size = size[::-1]
+        width, height = fit(size, box)
+        draft(source, width / size[0])
+        image = ImageOps.exif_transpose(source)
+    mode = 'RGBA' if image_format == 'WEBP' and has_alpha(image) else 'RGB'
+    image = image.convert(mode).resize((width, height), Image.LANCZOS)
+    output = BytesIO()
+    if image_format == 'JPEG':
+        image.save(
+            output, 'JPEG', quality=settings.IMAGE_QUALITY,
+            optimize=True, progressive=True
+        )
+    else:
+        image.save(output, 'WEBP', quality=settings.IMAGE_QUALITY)
+    return output.getvalue()
+
+
+def normalize(upload):
+    """Обрабатывает загруженную картинку.
+
+    Возвращает файл для Post.image и значения полей поста с размерами и
+    превью. Слишком большие по числу пикселей картинки отклоняются по
+    заголовку, до декодирования, обрезанные и повреждённые - ошибкой
+    формы.
+    """
+    try:
+        return _normalize(upload)
+    except (OSError, Image.DecompressionBombError):
+        raise ValidationError(
+            'Файл повреждён или не является картинкой.',
+            code='broken_image',
+        )
+
+
+def _normalize(upload):
+    upload.seek(0)
+    with Image.open(upload) as source:
+        if source.width * source.height > settings.IMAGE_MAX_PIXELS:
+            raise ValidationError(
+                'Картинка слишком большая: не больше %(limit)d Мпикс.',
+                code='too_many_pixels',
+                params={'limit': settings.IMAGE_MAX_PIXELS // 10 ** 6},
+            )
+        if source.format == 'GIF':
+            fields = {
+                'image_width': source.width,
+                'image_height': source.height,
+                'image_placeholder': placeholder(source),
+            }
+            upload.seek(0)
+            return upload, fields
+        side = settings.IMAGE_MAX_SIDE
+        draft(source, side / max(source.size))
+        image = ImageOps.exif_transpose(source)
+    image.thumbnail((side, side), Image.LANCZOS)
+    output = BytesIO()
+    if has_alpha(image):
+        image.convert('RGBA').save(
+            output, 'WEBP', quality=settings.IMAGE_QUALITY
+        )
+        extension = '.webp'
+    else:
+        image.convert('RGB').save(
+            output, 'JPEG', quality=settings.IMAGE_QUALITY,
+            optimize=True, progressive=True
+        )
+        extension = '.jpg'
+    fields = {
+        'image_width': image.width,
+        'image_height': image.height,
+        'image_placeholder': placeholder(image),
+    }
+    name = os.path.splitext(os.path.basename(upload.name))[0] + extension
+    return ContentFile(output.getvalue(), name=name), fields
@@ -0,0 +1,57 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import images
+from posts.models import Post
+from posts.pool import process_map
+from posts.signals import refresh_posts
+
+FIELDS = ('image_width', 'image_height', 'image_placeholder')
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет размеры и превью картинок у постов, где их ещё нет. '
+        'Картинки читаются в пуле процессов, посты сохраняются пачками.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count(),
+            help='Размер пула; 0 - обрабатывать в этом процессе.'
+        )
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        last_pk = 0
+        total = 0
+        with process_map(options['processes']) as describe:
+            while True:
+                posts = list(Post.objects.filter(
+                    pk__gt=last_pk, image_width__isnull=True
+                ).exclude(image='').order_by('pk').only('pk', 'image')[
+                    :options['batch_size']
+                ])
+                if not posts:
+                    break
+                described = []
+                for post, fields in zip(posts, describe(
+                    images.describe_stored,
+                    [post.image.name for post in posts]
+                )):
+                    if fields is None:
+                        self.stderr.write(f'{post.image.name} не читается')
+                        continue
+                    for name, value in fields.items():
+                        setattr(post, name, value)
+                    described.append(post)
+                with transaction.atomic():
+                    Post.objects.bulk_update(described, FIELDS)
+                    refresh_posts(Post.objects.filter(
+                        pk__in=[post.pk for post in described]
+                    ))
+                last_pk = posts[-1].pk
+                total += len(described)
+        self.stdout.write(f'Заполнено постов: {total}.')
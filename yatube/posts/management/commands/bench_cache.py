@@ -0,0 +1,137 @@
+import itertools
+import multiprocessing
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+BACKENDS = (
+    ('LocMemCache', 'django.core.cache.backends.locmem.LocMemCache', ''),
+    ('FileBasedCache', 'django.core.cache.backends.filebased.FileBasedCache',
+     'files'),
+    ('SQLiteCache', 'core.cache.SQLiteCache', 'cache.sqlite3'),
+    ('HotCache', 'core.cache.HotCache', 'cache.sqlite3'),
+)
+
+
+def memory():
+    """Память процесса в байтах.
+
+    PSS делит общие страницы (в том числе отображённый файл кэша) между
+    процессами, поэтому сумма по процессам - их общая память.
+    """
+    try:
+        with open('/proc/self/smaps_rollup') as rollup:
+            for line in rollup:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def worker(backend, location, keys, value_size, requests, writes, seed):
+    """Читает случайные ключи, как процесс сервера страницы.
+
+    Каждый запрос читает один ключ, промах кладёт значение в кэш. Ключ
+    с номером n читается в n раз реже первого, как страницы ленты. Доля
+    writes запросов перезаписывает ключ, как сброс страницы после поста.
+    Возвращает попадания, промахи, время попаданий во второй половине
+    запросов, когда кэш прогрет, в микросекундах и прирост памяти.
+    """
+    cache = import_string(backend)(location, {
+        'OPTIONS': {'MAX_ENTRIES': keys * 2}
+    })
+    generator = random.Random(seed)
+    names = [f'page:{number}' for number in range(keys)]
+    weights = list(itertools.accumulate(
+        1 / number for number in range(1, keys + 1)
+    ))
+    before = memory()
+    timings = []
+    hits = misses = 0
+    for number in range(requests):
+        key = generator.choices(names, cum_weights=weights)[0]
+        if generator.random() < writes:
+            cache.set(key, os.urandom(value_size), None)
+            cache.close()
+            continue
+        start = time.perf_counter()
+        value = cache.get(key)
+        elapsed = time.perf_counter() - start
+        if value is None:
+            misses += 1
+            cache.set(key, os.urandom(value_size), None)
+        else:
+            hits += 1
+            if number >= requests // 2:
+                timings.append(elapsed * 10 ** 6)
+        # Как request_finished в конце каждого запроса.
+        cache.close()
+    return hits, misses, timings, memory() - before
+
+
+def disk_usage(path):
+    return sum(
+        os.path.getsize(os.path.join(directory, name))
+        for directory, _, names in os.walk(path) for name in names
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает LocMemCache, FileBasedCache, SQLiteCache и HotCache под '
+        'нагрузкой нескольких процессов: долю попаданий, время '
+        'попадания и память всех процессов вместе с файлами кэша.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--keys', type=int, default=200)
+        parser.add_argument('--value-size', type=int, default=20000)
+        parser.add_argument(
+            '--writes', type=float, default=0.01,
+            help='Доля запросов, перезаписывающих ключ.'
+        )
+
+    def run(self, backend, location, options):
+        context = multiprocessing.get_context('fork')
+        with context.Pool(options['processes']) as pool:
+            return pool.starmap(worker, [
+                (backend, location, options['keys'], options['value_size'],
+                 options['requests'], options['writes'], seed)
+                for seed in range(options['processes'])
+            ])
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp(prefix='bench-cache-')
+        try:
+            for name, backend, location in BACKENDS:
+                path = os.path.join(directory, name, location)
+                results = self.run(
+                    backend, path if location else name, options
+                )
+                hits = sum(result[0] for result in results)
+                misses = sum(result[1] for result in results)
+                timings = sorted(
+                    timing for result in results for timing in result[2]
+                )
+                resident = sum(result[3] for result in results)
+                stored = disk_usage(os.path.join(directory, name))
+                p99 = timings[int(len(timings) * 0.99)] if timings else 0
+                self.stdout.write(
+                    f'{name:<15} hits: {hits / (hits + misses):6.1%}  '
+                    f'hit median: {statistics.median(timings or [0]):7.1f} '
+                    f'us  p99: {p99:7.1f} us  '
+                    f'memory: {resident / 2 ** 20:7.1f} MB  '
+                    f'disk: {stored / 2 ** 20:7.1f} MB'
+                )
+        finally:
+            shutil.rmtree(directory, True)
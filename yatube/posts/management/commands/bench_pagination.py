@@ -0,0 +1,69 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import transaction
+
+from posts.models import Post, User
+from posts.utils import (
+    NEXT, POSTS_PER_PAGE, CursorPaginator, encode_cursor
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает время выборки первой и глубокой страницы ленты '
+        'для Paginator (COUNT + OFFSET) и CursorPaginator. '
+        'Тестовые данные создаются в транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=50010)
+        parser.add_argument('--page', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
+
+    def handle(self, *args, **options):
+        page = options['page']
+        repeat = options['repeat']
+        with transaction.atomic():
+            author = User.objects.create_user(username='bench_pagination')
+            Post.objects.bulk_create(
+                Post(text='Тест паджинатора', author=author)
+                for _ in range(options['posts'])
+            )
+            posts = Post.objects.select_related('author', 'group')
+            anchor = posts.order_by('-pub_date', '-pk').values_list(
+                'pub_date', 'pk'
+            )[(page - 1) * POSTS_PER_PAGE - 1]
+            deep_cursor = encode_cursor(NEXT, anchor)
+
+            def offset_page(number):
+                return lambda: list(
+                    Paginator(posts, POSTS_PER_PAGE).get_page(number)
+                )
+
+            def cursor_page(cursor):
+                return lambda: list(
+                    CursorPaginator(posts, POSTS_PER_PAGE).get_page(cursor)
+                )
+
+            results = (
+                ('Paginator', offset_page(1), offset_page(page)),
+                ('CursorPaginator', cursor_page(None),
+                 cursor_page(deep_cursor)),
+            )
+            for name, first, deep in results:
+                self.stdout.write(
+                    f'{name:<16} page 1: {self.measure(first, repeat):8.2f} '
+                    f'ms   page {page}: {self.measure(deep, repeat):8.2f} ms'
+                )
+            transaction.set_rollback(True)
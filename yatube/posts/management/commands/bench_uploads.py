@@ -0,0 +1,79 @@
+import multiprocessing
+import resource
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from posts import images
+
+
+def full_decode(upload):
+    """Обработка без режима draft: оригинал декодируется целиком."""
+    with Image.open(upload) as image:
+        image.load()
+        side = settings.IMAGE_MAX_SIDE
+        image.thumbnail((side, side), Image.LANCZOS)
+        image.convert('RGB').save(
+            BytesIO(), 'JPEG', quality=settings.IMAGE_QUALITY,
+            optimize=True, progressive=True
+        )
+
+
+VARIANTS = {
+    'full decode': full_decode,
+    'normalize': images.normalize,
+}
+
+
+def measure(variant, data, repeat):
+    """Медиана времени и прирост пикового RSS, в отдельном процессе."""
+    process = VARIANTS[variant]
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = []
+    for _ in range(repeat):
+        upload = SimpleUploadedFile('bench.jpg', data, 'image/jpeg')
+        start = time.perf_counter()
+        process(upload)
+        timings.append((time.perf_counter() - start) * 1000)
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return statistics.median(timings), (after - before) / 1024
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает время и пиковую память обработки загруженного JPEG '
+        'с полным декодированием и в режиме draft (posts.images). '
+        'Каждый вариант выполняется в свежем процессе.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--width', type=int, default=5472)
+        parser.add_argument('--height', type=int, default=3648)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        size = (options['width'], options['height'])
+        source = Image.effect_noise(size, 64).convert('RGB')
+        output = BytesIO()
+        source.save(output, 'JPEG', quality=90)
+        data = output.getvalue()
+        del source
+        self.stdout.write(
+            f'{size[0]}x{size[1]} JPEG, {len(data) / 2 ** 20:.1f} МБ'
+        )
+        context = multiprocessing.get_context('fork')
+        for variant in VARIANTS:
+            with ProcessPoolExecutor(1, mp_context=context) as pool:
+                milliseconds, rss = pool.submit(
+                    measure, variant, data, options['repeat']
+                ).result()
+            self.stdout.write(
+                f'{variant:<12} {milliseconds:8.1f} ms/загрузка   '
+                f'пиковый RSS +{rss:6.1f} МБ'
+            )
@@ -0,0 +1,108 @@
+import functools
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections, transaction
+
+from posts import writer
+from posts.models import Comment, Post, User
+
+MODES = ('direct', 'queue')
+
+
+def comment(post_id, user):
+    """Комментарий, как в add_comment: сначала чтение, затем запись."""
+    post = Post.objects.get(pk=post_id)
+    return Comment.objects.create(post=post, author=user, text='Комментарий')
+
+
+def worker(mode, threads, writes, post_id):
+    """Пишет комментарии из threads потоков, как процесс сервера.
+
+    В режиме direct каждый поток пишет сам в своей транзакции, как
+    представления до очереди, в режиме queue - через поток-писатель.
+    Возвращает число записей и ошибок database is locked.
+    """
+    user = User.objects.get(username='bench')
+    counts = {'writes': 0, 'locked': 0}
+    lock = threading.Lock()
+
+    def write():
+        for _ in range(writes):
+            try:
+                if mode == 'direct':
+                    with transaction.atomic():
+                        comment(post_id, user)
+                else:
+                    writer.run(functools.partial(comment, post_id, user))
+                event = 'writes'
+            except OperationalError as error:
+                if 'locked' not in str(error):
+                    raise
+                event = 'locked'
+            with lock:
+                counts[event] += 1
+        connections.close_all()
+
+    pool = [threading.Thread(target=write) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return counts['writes'], counts['locked']
+
+
+class Command(BaseCommand):
+    help = (
+        'Пишет комментарии из нескольких процессов и потоков во временную '
+        'базу напрямую и через поток-писатель. Показывает записи в секунду '
+        'и число ошибок database is locked.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument(
+            '--writes', type=int, default=200,
+            help='Записей в каждом потоке.'
+        )
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp(prefix='bench-writes-')
+        name = connection.settings_dict['NAME']
+        connections.close_all()
+        connection.settings_dict['NAME'] = os.path.join(
+            directory, 'db.sqlite3'
+        )
+        try:
+            call_command('migrate', verbosity=0)
+            user = User.objects.create_user(username='bench')
+            post_id = Post.objects.create(author=user, text='Пост').pk
+            connections.close_all()
+            for mode in MODES:
+                self.run(mode, post_id, options)
+        finally:
+            connections.close_all()
+            connection.settings_dict['NAME'] = name
+            shutil.rmtree(directory, True)
+
+    def run(self, mode, post_id, options):
+        context = multiprocessing.get_context('fork')
+        start = time.perf_counter()
+        with context.Pool(options['processes']) as pool:
+            results = pool.starmap(worker, [
+                (mode, options['threads'], options['writes'], post_id)
+            ] * options['processes'])
+        elapsed = time.perf_counter() - start
+        writes = sum(result[0] for result in results)
+        locked = sum(result[1] for result in results)
+        self.stdout.write(
+            f'{mode:<8} writes: {writes:6}  '
+            f'writes/s: {writes / elapsed:8.1f}  locked: {locked}'
+        )
@@ -0,0 +1,91 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+
+NO_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    }
+}
+
+
+def bad_plan_steps(sql):
+    """Шаги плана запроса с полным сканированием таблицы или сортировкой."""
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        steps = [row[-1] for row in cursor.fetchall()]
+    return [
+        step for step in steps
+        if (step.startswith('SCAN') and ' USING ' not in step)
+        or 'TEMP B-TREE' in step
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет EXPLAIN QUERY PLAN для запросов страниц index, '
+        'group_list, profile, follow_index (в том числе с постами '
+        'знаменитостей), post_detail, post_comments и RSS-лент и '
+        'завершается ошибкой, если какой-то запрос сканирует таблицу '
+        'целиком или сортирует результат во временном B-дереве.'
+    )
+
+    def pages(self):
+        """Создаёт данные для страниц.
+
+        Возвращает тройки (url, user, settings): settings переопределяются
+        на время запроса страницы.
+        """
+        author = User.objects.create_user(username='query_plan_author')
+        reader = User.objects.create_user(username='query_plan_reader')
+        group = Group.objects.create(
+            title='query plan', slug='query-plan', description='-'
+        )
+        Follow.objects.create(user=reader, author=author)
+        post = Post.objects.create(text='-', author=author, group=group)
+        Comment.objects.create(post=post, author=reader, text='-')
+        pages = (
+            (reverse('posts:index'), AnonymousUser()),
+            (reverse('posts:group_list', args=(group.slug,)), reader),
+            (reverse('posts:profile', args=(author.username,)), reader),
+            (reverse('posts:follow_index'), reader),
+            (reverse('posts:post_detail', args=(post.pk,)), reader),
+            (reverse('posts:post_comments', args=(post.pk,)), reader),
+            (reverse('posts:index_rss'), AnonymousUser()),
+            (reverse('posts:group_rss', args=(group.slug,)), reader),
+            (reverse('posts:profile_rss', args=(author.username,)), reader),
+        )
+        # С нулевым порогом автор - знаменитость, и его посты
+        # подмешиваются в ленту подписок при чтении.
+        celebrity = (
+            reverse('posts:follow_index'), reader,
+            {'TIMELINE_FANOUT_LIMIT': 0}
+        )
+        return tuple((url, user, {}) for url, user in pages) + (celebrity,)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Проверка планов поддерживает только SQLite.')
+        problems = []
+        with transaction.atomic(), override_settings(CACHES=NO_CACHE):
+            for url, user, page_settings in self.pages():
+                request = RequestFactory().get(url)
+                request.user = user
+                match = resolve(url)
+                with CaptureQueriesContext(connection) as queries, \
+                        override_settings(**page_settings):
+                    match.func(request, *match.args, **match.kwargs)
+                for query in queries:
+                    if not query['sql'].startswith('SELECT'):
+                        continue
+                    for step in bad_plan_steps(query['sql']):
+                        problems.append(f'{url}: {step}\n  {query["sql"]}')
+            transaction.set_rollback(True)
+        if problems:
+            raise CommandError('\n'.join(problems))
+        self.stdout.write('Планы запросов в порядке.')
@@ -0,0 +1,84 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import exports
+from posts.models import Post
+from posts.pool import process_map
+
+MANIFEST = 'media.txt'
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает группы, посты, комментарии и подписки в каталог: '
+        'каждая таблица делится на диапазоны pk по --part-size строк, '
+        'каждый диапазон пишется в свой файл в пуле процессов. Файлы '
+        'называются так, что в порядке имён их можно склеить и загрузить '
+        'командой import_yatube. Список картинок постов пишется в '
+        f'{MANIFEST}.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument(
+            '--format', choices=sorted(exports.LINES), default='jsonl'
+        )
+        parser.add_argument(
+            '--gzip', action='store_true', help='Сжимать файлы gzip.'
+        )
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count(),
+            help='Размер пула; 0 - выгружать в этом процессе.'
+        )
+        parser.add_argument('--part-size', type=int, default=100000)
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='Строк, читаемых из курсора за раз.'
+        )
+
+    def parts(self, directory, options):
+        suffix = f'.{options["format"]}' + ('.gz' if options['gzip'] else '')
+        for index, (kind, model) in enumerate(exports.MODELS.items()):
+            for part, (first, last) in enumerate(exports.ranges(
+                model.objects.all(), options['part_size']
+            )):
+                yield (
+                    kind, first, last,
+                    os.path.join(directory, f'{index}-{kind}-{part:05}'
+                                 + suffix),
+                    options['format'], options['gzip'],
+                    options['chunk_size'],
+                )
+
+    def write_manifest(self, directory, chunk_size):
+        images = Post.objects.exclude(image='').order_by('pk').values_list(
+            'image', flat=True
+        ).iterator(chunk_size)
+        with open(os.path.join(directory, MANIFEST), 'w') as manifest:
+            manifest.writelines(f'{name}\n' for name in images)
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        os.makedirs(directory, exist_ok=True)
+        start = time.perf_counter()
+        tasks = list(self.parts(directory, options))
+        counts = dict.fromkeys(exports.MODELS, 0)
+        if tasks:
+            with process_map(options['processes']) as export:
+                for kind, written in zip(
+                    (task[0] for task in tasks),
+                    export(exports.export_part, *zip(*tasks))
+                ):
+                    counts[kind] += written
+        self.write_manifest(directory, options['chunk_size'])
+        total = sum(counts.values())
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'Выгружено групп: {counts["group"]}, '
+            f'постов: {counts["post"]}, '
+            f'комментариев: {counts["comment"]}, '
+            f'подписок: {counts["follow"]} '
+            f'в {len(tasks)} файлов. {total / elapsed:.0f} строк/с.'
+        )
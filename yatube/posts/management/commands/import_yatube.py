@@ -0,0 +1,325 @@
+import gzip
+import json
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import caching, stats, thumbnails, timeline
+from posts.models import AuthorStats, Comment, Follow, Group, Post, User
+
+# Порядок записи пачки: строки ссылаются на группы и посты выше.
+TYPES = ('group', 'post', 'comment', 'follow')
+
+
+class SkipRecord(Exception):
+    pass
+
+
+def read_lines(path):
+    """Построчно читает файл, не загружая его в память; .gz распаковывает."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as lines:
+        for number, line in enumerate(lines, 1):
+            if line.strip():
+                yield number, line
+
+
+@contextmanager
+def keep_dates(*fields):
+    """Отключает auto_now_add, чтобы bulk_create сохранил даты из файла."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def required(record, key):
+    value = record.get(key)
+    if value in (None, ''):
+        raise SkipRecord(f'нет поля {key}')
+    return value
+
+
+def date(record, key):
+    value = record.get(key)
+    if value is None:
+        return timezone.now()
+    parsed = parse_datetime(str(value))
+    if parsed is None:
+        raise SkipRecord(f'неверная дата в поле {key}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает группы, посты, комментарии и подписки из JSON Lines '
+        '(можно .gz). Каждая строка - объект с полем type: '
+        'group {slug, title, description}; '
+        'post {id, author, text, group, pub_date, image}; '
+        'comment {id, post, author, text, created}; '
+        'follow {user, author}. '
+        'Авторы указываются по username и создаются при отсутствии. '
+        'Строки пишутся пачками bulk_create, каждая пачка в своей '
+        'транзакции; уже загруженные id и подписки пропускаются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Строк в одной пачке и транзакции.'
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        self.users = {}
+        self.usernames = {}
+        self.groups = dict(Group.objects.values_list('slug', 'pk'))
+        self.slugs = {pk: slug for slug, pk in self.groups.items()}
+        self.counts = dict.fromkeys(TYPES, 0)
+        self.skipped = 0
+        batch = {kind: [] for kind in TYPES}
+        size = 0
+        start = time.perf_counter()
+        with keep_dates(
+            Post._meta.get_field('pub_date'),
+            Comment._meta.get_field('created')
+        ):
+            for number, line in read_lines(options['path']):
+                try:
+                    record = json.loads(line)
+                    kind = record['type']
+                    batch[kind].append((number, record))
+                except (ValueError, KeyError, TypeError):
+                    self.skip(number, 'не объект с известным type')
+                    continue
+                size += 1
+                if size >= options['batch_size']:
+                    self.flush(batch, start)
+                    batch = {kind: [] for kind in TYPES}
+                    size = 0
+            self.flush(batch, start)
+        total = sum(self.counts.values())
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'Загружено групп: {self.counts["group"]}, '
+            f'постов: {self.counts["post"]}, '
+            f'комментариев: {self.counts["comment"]}, '
+            f'подписок: {self.counts["follow"]}; '
+            f'пропущено строк: {self.skipped}. '
+            f'{total / elapsed:.0f} строк/с.'
+        )
+
+    def skip(self, number, reason):
+        self.skipped += 1
+        self.stderr.write(f'Строка {number}: {reason}')
+
+    def build(self, rows, make):
+        """Пары (номер строки, объект) для записей, прошедших проверку."""
+        objects = []
+        for number, record in rows:
+            try:
+                objects.append((number, make(record)))
+            except SkipRecord as error:
+                self.skip(number, error)
+        return objects
+
+    def flush(self, batch, start):
+        scopes = set()
+        with transaction.atomic():
+            self.add_groups(batch['group'])
+            self.resolve_users(
+                record.get(key)
+                for kind in ('post', 'comment', 'follow')
+                for _, record in batch[kind]
+                for key in ('author', 'user')
+            )
+            scopes.update(self.add_posts(batch['post']))
+            scopes.update(self.add_comments(batch['comment']))
+            scopes.update(self.add_follows(batch['follow']))
+        # Кэш сбрасывается после записи, как это делают сигналы.
+        caching.bump(*scopes)
+        if self.verbosity > 1:
+            total = sum(self.counts.values())
+            rate = total / (time.perf_counter() - start)
+            self.stdout.write(f'{total} строк, {rate:.0f} строк/с')
+
+    def add_groups(self, rows):
+        for number, record in rows:
+            try:
+                slug = required(record, 'slug')
+                group, created = Group.objects.get_or_create(
+                    slug=slug,
+                    defaults={
+                        'title': required(record, 'title'),
+                        'description': record.get('description', ''),
+                    }
+                )
+            except SkipRecord as error:
+                self.skip(number, error)
+                continue
+            self.groups[slug] = group.pk
+            self.slugs[group.pk] = slug
+            self.counts['group'] += created
+
+    def resolve_users(self, usernames):
+        """Находит id авторов по username, недостающих создаёт.
+
+        Найденные id остаются в self.users, поэтому каждое имя ищется в
+        базе один раз за весь импорт.
+        """
+        missing = {
+            name for name in usernames
+            if isinstance(name, str) and name and name not in self.users
+        }
+        if not missing:
+            return
+        found = dict(User.objects.filter(
+            username__in=missing
+        ).values_list('username', 'pk'))
+        missing -= set(found)
+        if missing:
+            User.objects.bulk_create(
+                User(username=name, password=make_password(None))
+                for name in missing
+            )
+            created = dict(User.objects.filter(
+                username__in=missing
+            ).values_list('username', 'pk'))
+            # Сигнал создания пользователя при bulk_create не срабатывает.
+            AuthorStats.objects.bulk_create(
+                AuthorStats(user_id=user_id) for user_id in created.values()
+            )
+            found.update(created)
+        self.users.update(found)
+        self.usernames.update((pk, name) for name, pk in found.items())
+
+    def user_id(self, record, key):
+        name = required(record, key)
+        if not isinstance(name, str) or name not in self.users:
+            raise SkipRecord(f'неверное поле {key}')
+        return self.users[name]
+
+    def author_scope(self, user_id):
+        return caching.AUTHOR.format(username=self.usernames[user_id])
+
+    def make_post(self, record):
+        slug = record.get('group') or None
+        if slug is not None and (
+            not isinstance(slug, str) or slug not in self.groups
+        ):
+            raise SkipRecord(f'нет группы {slug}')
+        try:
+            pk = int(required(record, 'id'))
+        except (TypeError, ValueError):
+            raise SkipRecord('неверный id')
+        return Post(
+            pk=pk,
+            author_id=self.user_id(record, 'author'),
+            group_id=self.groups.get(slug),
+            text=required(record, 'text'),
+            pub_date=date(record, 'pub_date'),
+            image=record.get('image') or '',
+        )
+
+    def add_posts(self, rows):
+        posts = [post for _, post in self.build(rows, self.make_post)]
+        # Уже загруженные посты пропускаются, так что импорт можно
+        # перезапустить с начала файла.
+        existing = set(Post.objects.filter(
+            pk__in=[post.pk for post in posts]
+        ).values_list('pk', flat=True))
+        posts = list({
+            post.pk: post for post in posts if post.pk not in existing
+        }.values())
+        if not posts:
+            return ()
+        Post.objects.bulk_create(posts)
+        stats.count_posts(posts)
+        timeline.fan_out_many(posts)
+        thumbnails.enqueue(*(post.image.name for post in posts if post.image))
+        self.counts['post'] += len(posts)
+        return {caching.POSTS} | {
+            self.author_scope(post.author_id) for post in posts
+        } | {
+            caching.GROUP.format(slug=self.slugs[post.group_id])
+            for post in posts if post.group_id is not None
+        }
+
+    def make_comment(self, record):
+        try:
+            pk = int(required(record, 'id'))
+            post_id = int(required(record, 'post'))
+        except (TypeError, ValueError):
+            raise SkipRecord('неверный id')
+        return Comment(
+            pk=pk,
+            post_id=post_id,
+            author_id=self.user_id(record, 'author'),
+            text=required(record, 'text'),
+            created=date(record, 'created'),
+        )
+
+    def add_comments(self, rows):
+        comments = self.build(rows, self.make_comment)
+        posts = set(Post.objects.filter(
+            pk__in={comment.post_id for _, comment in comments}
+        ).values_list('pk', flat=True))
+        existing = set(Comment.objects.filter(
+            pk__in=[comment.pk for _, comment in comments]
+        ).values_list('pk', flat=True))
+        fresh = []
+        for number, comment in comments:
+            if comment.post_id not in posts:
+                self.skip(number, f'нет поста {comment.post_id}')
+            elif comment.pk not in existing:
+                existing.add(comment.pk)
+                fresh.append(comment)
+        if not fresh:
+            return ()
+        Comment.objects.bulk_create(fresh)
+        stats.count_comments(fresh)
+        self.counts['comment'] += len(fresh)
+        return {
+            caching.POST.format(post_id=comment.post_id) for comment in fresh
+        }
+
+    def make_follow(self, record):
+        follow = Follow(
+            user_id=self.user_id(record, 'user'),
+            author_id=self.user_id(record, 'author'),
+        )
+        if follow.user_id == follow.author_id:
+            raise SkipRecord('подписка на себя')
+        return follow
+
+    def add_follows(self, rows):
+        follows = [follow for _, follow in self.build(rows, self.make_follow)]
+        existing = set(Follow.objects.filter(
+            user_id__in={follow.user_id for follow in follows},
+            author_id__in={follow.author_id for follow in follows},
+        ).values_list('user_id', 'author_id'))
+        follows = list({
+            (follow.user_id, follow.author_id): follow for follow in follows
+            if (follow.user_id, follow.author_id) not in existing
+        }.values())
+        if not follows:
+            return ()
+        Follow.objects.bulk_create(follows)
+        stats.count_follows(follows)
+        timeline.backfill_many(follows)
+        self.counts['follow'] += len(follows)
+        return {self.author_scope(follow.author_id) for follow in follows} | {
+            caching.FOLLOWING.format(user_id=follow.user_id)
+            for follow in follows
+        }
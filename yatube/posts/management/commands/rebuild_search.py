@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = (
+        'Заново строит поисковый индекс постов и комментариев пачками, '
+        'каждая в своей транзакции. Пока команда работает, поиск находит '
+        'не всё.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            self.stdout.write('Поисковый индекс нужен только для SQLite.')
+            return
+        search.rebuild(
+            options['batch_size'],
+            lambda model, last_pk: self.stdout.write(
+                f'{model._meta.verbose_name_plural}: до id {last_pk}'
+            )
+        )
+        self.stdout.write('Поисковый индекс перестроен.')
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import stats
+from posts.models import Group, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики AuthorStats и GroupStats по данным '
+        'Post, Comment и Follow пачками, каждая в своей транзакции, '
+        'и счётчики постов по дням DayStats.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def recount(self, model, recount_batch, batch_size):
+        last_pk = 0
+        total = 0
+        while True:
+            ids = list(
+                model.objects.filter(pk__gt=last_pk).order_by(
+                    'pk'
+                ).values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                return total
+            with transaction.atomic():
+                recount_batch(ids)
+            last_pk = ids[-1]
+            total += len(ids)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        authors = self.recount(User, stats.recount_authors, batch_size)
+        groups = self.recount(Group, stats.recount_groups, batch_size)
+        with transaction.atomic():
+            days = stats.recount_days()
+        self.stdout.write(
+            f'Пересчитано авторов: {authors}, групп: {groups}, '
+            f'дней: {days}.'
+        )
@@ -0,0 +1,29 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from posts import caching
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает, сколько раз страницы лент перестраивались и сколько '
+        'перестроек удалось избежать: запрос дождался чужой перестройки '
+        'в своём или другом процессе или получил старую страницу, пока '
+        'её заранее перестраивал другой запрос.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true', help='Обнулить счётчики.'
+        )
+
+    def handle(self, *args, **options):
+        counts = caching.stampede_stats()
+        for event, count in counts.items():
+            self.stdout.write(f'{event:<15} {count}')
+        avoided = counts['coalesced'] + counts['waited'] + counts['stale']
+        self.stdout.write(f'{"avoided":<15} {avoided}')
+        if options['reset']:
+            cache.delete_many(
+                f'stampede:{event}' for event in caching.STAMPEDE_EVENTS
+            )
@@ -0,0 +1,65 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from posts import thumbnails
+from posts.models import Post, ThumbnailJob
+from posts.pool import process_map
+from posts.signals import refresh_posts
+
+
+class Command(BaseCommand):
+    help = (
+        'Забирает задачи ThumbnailJob и создаёт миниатюры в пуле '
+        'процессов. После создания сбрасывает кэш страниц с постами, '
+        'где до этого выводилась заглушка. Рассчитана на один экземпляр.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count(),
+            help='Размер пула; 0 - генерировать в этом процессе.'
+        )
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--max-attempts', type=int, default=3)
+        parser.add_argument('--poll', type=float, default=2.0)
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Разобрать очередь и выйти.'
+        )
+
+    def process(self, jobs, generate):
+        names = [job.image for job in jobs]
+        done = []
+        for job, error in zip(jobs, generate(thumbnails.generate, names)):
+            if error is None:
+                done.append(job.image)
+            else:
+                self.stderr.write(f'{job.image}: {error}')
+                ThumbnailJob.objects.filter(pk=job.pk).update(
+                    attempts=F('attempts') + 1
+                )
+        ThumbnailJob.objects.filter(image__in=done).delete()
+        if done:
+            # Карточки постов кэшируются по дате изменения поста.
+            with transaction.atomic():
+                refresh_posts(Post.objects.filter(image__in=done))
+        return len(done)
+
+    def handle(self, *args, **options):
+        total = 0
+        with process_map(options['processes']) as generate:
+            while True:
+                jobs = list(ThumbnailJob.objects.filter(
+                    attempts__lt=options['max_attempts']
+                )[:options['batch_size']])
+                if jobs:
+                    total += self.process(jobs, generate)
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['poll'])
+        self.stdout.write(f'Обработано картинок: {total}.')
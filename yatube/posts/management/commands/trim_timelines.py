@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import timeline
+
+
+class Command(BaseCommand):
+    help = (
+        'Обрезает до TIMELINE_LENGTH последних записей ленты подписок, '
+        'переросшие его больше чем на TIMELINE_TRIM_SLACK записей. '
+        'Запускается по расписанию: раскладка постов ленты не обрезает.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--slack', type=int, default=settings.TIMELINE_TRIM_SLACK,
+            help='Сколько лишних записей оставить в ленте без обрезки.'
+        )
+
+    def handle(self, *args, **options):
+        user_ids = list(timeline.overfull_users(options['slack']))
+        for user_id in user_ids:
+            # Каждая лента в своей транзакции, чтобы не держать запись.
+            with transaction.atomic():
+                timeline.trim(user_id)
+        self.stdout.write(f'Обрезано лент: {len(user_ids)}.')
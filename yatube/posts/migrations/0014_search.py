@@ -0,0 +1,98 @@
+from django.db import migrations
+
+CREATE = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS posts_post_fts USING fts5(
+        text,
+        content='posts_post', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS posts_comment_fts USING fts5(
+        text, post_id UNINDEXED,
+        content='posts_comment', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_post_fts_insert
+    AFTER INSERT ON posts_post BEGIN
+        INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_post_fts_delete
+    AFTER DELETE ON posts_post BEGIN
+        INSERT INTO posts_post_fts(posts_post_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_post_fts_update
+    AFTER UPDATE OF text ON posts_post BEGIN
+        INSERT INTO posts_post_fts(posts_post_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_comment_fts_insert
+    AFTER INSERT ON posts_comment BEGIN
+        INSERT INTO posts_comment_fts(rowid, text, post_id)
+        VALUES (new.id, new.text, new.post_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_comment_fts_delete
+    AFTER DELETE ON posts_comment BEGIN
+        INSERT INTO posts_comment_fts(posts_comment_fts, rowid, text, post_id)
+        VALUES ('delete', old.id, old.text, old.post_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_comment_fts_update
+    AFTER UPDATE OF text, post_id ON posts_comment BEGIN
+        INSERT INTO posts_comment_fts(posts_comment_fts, rowid, text, post_id)
+        VALUES ('delete', old.id, old.text, old.post_id);
+        INSERT INTO posts_comment_fts(rowid, text, post_id)
+        VALUES (new.id, new.text, new.post_id);
+    END
+    """,
+    "INSERT INTO posts_post_fts(posts_post_fts) VALUES ('rebuild')",
+    "INSERT INTO posts_comment_fts(posts_comment_fts) VALUES ('rebuild')",
+)
+
+DROP = (
+    'DROP TRIGGER IF EXISTS posts_post_fts_insert',
+    'DROP TRIGGER IF EXISTS posts_post_fts_delete',
+    'DROP TRIGGER IF EXISTS posts_post_fts_update',
+    'DROP TRIGGER IF EXISTS posts_comment_fts_insert',
+    'DROP TRIGGER IF EXISTS posts_comment_fts_delete',
+    'DROP TRIGGER IF EXISTS posts_comment_fts_update',
+    'DROP TABLE IF EXISTS posts_post_fts',
+    'DROP TABLE IF EXISTS posts_comment_fts',
+)
+
+
+class SQLiteRunSQL(migrations.RunSQL):
+    """RunSQL, выполняемый только на SQLite: FTS5 есть только там."""
+
+    def database_forwards(self, app_label, schema_editor, *args):
+        if schema_editor.connection.vendor == 'sqlite':
+            super().database_forwards(app_label, schema_editor, *args)
+
+    def database_backwards(self, app_label, schema_editor, *args):
+        if schema_editor.connection.vendor == 'sqlite':
+            super().database_backwards(app_label, schema_editor, *args)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_post_image_dimensions'),
+    ]
+
+    operations = [
+        SQLiteRunSQL(CREATE, DROP),
+    ]
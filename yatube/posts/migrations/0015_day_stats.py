@@ -0,0 +1,39 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:08
+
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def fill_day_stats(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    DayStats = apps.get_model('posts', 'DayStats')
+    DayStats.objects.bulk_create(
+        DayStats(day=day, posts_count=total)
+        for day, total in Post.objects.order_by().annotate(
+            day=TruncDate('pub_date')
+        ).values('day').annotate(
+            total=models.Count('pk')
+        ).values_list('day', 'total')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DayStats',
+            fields=[
+                ('day', models.DateField(primary_key=True, serialize=False, verbose_name='День')),
+                ('posts_count', models.IntegerField(default=0, verbose_name='Постов')),
+            ],
+            options={
+                'verbose_name': 'Статистика дня',
+                'verbose_name_plural': 'Статистика дней',
+            },
+        ),
+        migrations.RunPython(fill_day_stats, migrations.RunPython.noop),
+    ]
@@ -15,6 +15,10 @@ class Post(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации'
     )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -35,11 +39,42 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    # Заполняются при загрузке картинки и командой backfill_images, чтобы
+    # шаблоны знали пропорции картинки, не открывая файл.
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки',
+        null=True,
+        blank=True
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки',
+        null=True,
+        blank=True
+    )
+    image_placeholder = models.TextField(
+        'Превью картинки',
+        blank=True,
+        help_text='data: URI размытой копии картинки в несколько пикселей'
+    )
 
     class Meta:
         verbose_name = 'Публикация пользователя'
         verbose_name_plural = 'Публикации пользователей'
         ordering = ('-pub_date', )
+        indexes = [
+            models.Index(
+                fields=['pub_date', 'id'],
+                name='post_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['author', 'pub_date', 'id'],
+                name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', 'pub_date', 'id'],
+                name='post_group_pub_date_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.text[:15]
@@ -90,6 +125,12 @@ class Comment(models.Model):
         verbose_name = 'Комментарий пользователя'
         verbose_name_plural = 'Комментарии пользователей'
         ordering = ('-created', )
+        indexes = [
+            models.Index(
+                fields=['post', 'created', 'id'],
+                name='comment_post_created_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.text[:15]
@@ -118,3 +159,120 @@ class Follow(models.Model):
                 name='unique_user_author'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='follow_author_user_idx'
+            ),
+        ]
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Читатель'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Публикация'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_timeline_user_post'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'pub_date', 'post'],
+                name='timeline_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='timeline_user_author_idx'
+            ),
+        ]
+
+
+class AuthorStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Автор'
+    )
+    posts_count = models.IntegerField('Постов', default=0)
+    comments_count = models.IntegerField('Комментариев', default=0)
+    followers_count = models.IntegerField(
+        'Подписчиков',
+        default=0,
+        db_index=True
+    )
+    following_count = models.IntegerField('Подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Статистика автора'
+        verbose_name_plural = 'Статистика авторов'
+
+    def __str__(self) -> str:
+        return str(self.user)
+
+
+class GroupStats(models.Model):
+    group = models.OneToOneField(
+        Group,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Группа'
+    )
+    posts_count = models.IntegerField('Постов', default=0)
+
+    class Meta:
+        verbose_name = 'Статистика группы'
+        verbose_name_plural = 'Статистика групп'
+
+    def __str__(self) -> str:
+        return str(self.group)
+
+
+class DayStats(models.Model):
+    day = models.DateField('День', primary_key=True)
+    posts_count = models.IntegerField('Постов', default=0)
+
+    class Meta:
+        verbose_name = 'Статистика дня'
+        verbose_name_plural = 'Статистика дней'
+
+    def __str__(self) -> str:
+        return str(self.day)
+
+
+class ThumbnailJob(models.Model):
+    image = models.CharField('Картинка', max_length=100, unique=True)
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    created = models.DateTimeField('Поставлена в очередь', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Задача на миниатюры'
+        verbose_name_plural = 'Задачи на миниатюры'
+        ordering = ('created', 'id')
+
+    def __str__(self) -> str:
+        return self.image
@@ -0,0 +1,23 @@
+"""Пул процессов для фоновых команд."""
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import django
+from django.db import connections
+
+
+def init_worker():
+    django.setup()
+    connections.close_all()
+
+
+@contextmanager
+def process_map(processes):
+    """Отдаёт map по пулу из processes процессов, при 0 - обычный map."""
+    if not processes:
+        yield map
+        return
+    # Соединения с базой не должны достаться дочерним процессам.
+    connections.close_all()
+    with ProcessPoolExecutor(processes, initializer=init_worker) as pool:
+        yield pool.map
@@ -0,0 +1,198 @@
+"""Полнотекстовый поиск по постам и комментариям на SQLite FTS5.
+
+Таблицы posts_post_fts и posts_comment_fts индексируют текст постов и
+комментариев без копии самих данных (external content) и обновляются
+триггерами, поэтому в индекс попадают и bulk_create, и update().
+Таблицы и триггеры создаёт миграция 0014_search. Пересоздание таблицы
+posts_post миграцией удаляет её триггеры, поэтому install восстанавливает
+их после каждой миграции. Существующие строки индексирует команда
+rebuild_search.
+
+На других СУБД поиск сводится к icontains.
+"""
+import re
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models.expressions import RawSQL
+
+from .models import Comment, Post
+
+SCHEMA = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS posts_post_fts USING fts5(
+        text,
+        content='posts_post', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS posts_comment_fts USING fts5(
+        text, post_id UNINDEXED,
+        content='posts_comment', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_post_fts_insert
+    AFTER INSERT ON posts_post BEGIN
+        INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_post_fts_delete
+    AFTER DELETE ON posts_post BEGIN
+        INSERT INTO posts_post_fts(posts_post_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_post_fts_update
+    AFTER UPDATE OF text ON posts_post BEGIN
+        INSERT INTO posts_post_fts(posts_post_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_comment_fts_insert
+    AFTER INSERT ON posts_comment BEGIN
+        INSERT INTO posts_comment_fts(rowid, text, post_id)
+        VALUES (new.id, new.text, new.post_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_comment_fts_delete
+    AFTER DELETE ON posts_comment BEGIN
+        INSERT INTO posts_comment_fts(posts_comment_fts, rowid, text, post_id)
+        VALUES ('delete', old.id, old.text, old.post_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS posts_comment_fts_update
+    AFTER UPDATE OF text, post_id ON posts_comment BEGIN
+        INSERT INTO posts_comment_fts(posts_comment_fts, rowid, text, post_id)
+        VALUES ('delete', old.id, old.text, old.post_id);
+        INSERT INTO posts_comment_fts(rowid, text, post_id)
+        VALUES (new.id, new.text, new.post_id);
+    END
+    """,
+)
+
+# Совпадение в комментарии весит вдвое меньше совпадения в тексте поста.
+# bm25 тем лучше, чем меньше, поэтому ранг комментария умножается на 0.5.
+RANKED_POSTS = """
+    SELECT post_id FROM (
+        SELECT rowid AS post_id, bm25(posts_post_fts) AS rank
+        FROM posts_post_fts WHERE posts_post_fts MATCH %s
+        UNION ALL
+        SELECT post_id, bm25(posts_comment_fts) * 0.5 AS rank
+        FROM posts_comment_fts WHERE posts_comment_fts MATCH %s
+    )
+    GROUP BY post_id
+    ORDER BY MIN(rank), post_id DESC
+    LIMIT %s
+"""
+
+MAX_TERMS = 10
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def install(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Восстанавливает триггеры поиска, если миграция поиска применена.
+
+    Подключён к post_migrate.
+    """
+    database = connections[using]
+    if database.vendor != 'sqlite':
+        return
+    tables = database.introspection.table_names()
+    if not {'posts_post_fts', 'posts_comment_fts'} <= set(tables):
+        return
+    with database.cursor() as cursor:
+        for statement in SCHEMA:
+            cursor.execute(statement)
+
+
+def match_query(text):
+    """Запрос FTS5 из введённой строки.
+
+    Каждое слово ищется как префикс, все слова должны встретиться.
+    Синтаксис FTS5 из ввода не используется, поэтому запрос не может
+    оказаться некорректным.
+    """
+    terms = re.findall(r'\w+', text)[:MAX_TERMS]
+    return ' '.join('"{}"*'.format(term) for term in terms)
+
+
+def ranked_post_ids(text, limit=None):
+    """id постов, подходящих под запрос, от самых релевантных."""
+    query = match_query(text)
+    if not query:
+        return []
+    limit = limit or settings.SEARCH_RESULTS_LIMIT
+    if not is_available():
+        return list(Post.objects.filter(text__icontains=text).values_list(
+            'pk', flat=True
+        )[:limit])
+    with connection.cursor() as cursor:
+        cursor.execute(RANKED_POSTS, [query, query, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _matching(queryset, table, text):
+    query = match_query(text)
+    if not query:
+        return queryset.none()
+    if not is_available():
+        return queryset.filter(text__icontains=text)
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [query]
+    ))
+
+
+def matching_posts(queryset, text):
+    return _matching(queryset, 'posts_post_fts', text)
+
+
+def matching_comments(queryset, text):
+    return _matching(queryset, 'posts_comment_fts', text)
+
+
+def rebuild(batch_size, progress=None):
+    """Заново индексирует все посты и комментарии пачками по batch_size.
+
+    Каждая пачка записывается в своей транзакции, чтобы не держать
+    блокировку базы на всё время переиндексации.
+    """
+    install()
+    for model, table, columns in (
+        (Post, 'posts_post_fts', 'text'),
+        (Comment, 'posts_comment_fts', 'text, post_id'),
+    ):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table}({table}) VALUES ('delete-all')"
+            )
+        last_pk = 0
+        while True:
+            ids = list(model.objects.filter(pk__gt=last_pk).order_by(
+                'pk'
+            ).values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {table}(rowid, {columns}) '
+                    f'SELECT id, {columns} FROM {model._meta.db_table} '
+                    f'WHERE id BETWEEN %s AND %s',
+                    [ids[0], ids[-1]]
+                )
+            last_pk = ids[-1]
+            if progress:
+                progress(model, last_pk)
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {table}({table}) VALUES ('optimize')")
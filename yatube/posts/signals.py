@@ -0,0 +1,148 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import caching, stats, thumbnails, timeline
+from .models import (
+    AuthorStats, Comment, Follow, Group, GroupStats, Post, User
+)
+
+
+def invalidate_post(post, *group_ids):
+    slugs = Group.objects.filter(
+        pk__in=[group_id for group_id in group_ids if group_id is not None]
+    ).values_list('slug', flat=True)
+    caching.bump_on_commit(
+        caching.POSTS,
+        caching.POST.format(post_id=post.pk),
+        caching.AUTHOR.format(username=post.author.username),
+        *(caching.GROUP.format(slug=slug) for slug in slugs)
+    )
+
+
+def refresh_posts(posts):
+    """Сбрасывает кэши постов, изменённых в обход save()."""
+    posts.update(updated=timezone.now())
+    for post in posts.select_related('author'):
+        invalidate_post(post, post.group_id)
+
+
+def is_login_update(update_fields):
+    return update_fields is not None and set(update_fields) == {'last_login'}
+
+
+@receiver(pre_save, sender=User)
+def remember_username(sender, instance, update_fields, **kwargs):
+    if instance.pk is not None and not is_login_update(update_fields):
+        instance._saved_username = User.objects.filter(
+            pk=instance.pk
+        ).values_list('username', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields, **kwargs):
+    if created:
+        AuthorStats.objects.get_or_create(user=instance)
+    elif not is_login_update(update_fields):
+        usernames = {
+            instance.username,
+            getattr(instance, '_saved_username', instance.username)
+        }
+        caching.bump_on_commit(
+            caching.USERS,
+            *(caching.AUTHOR.format(username=name) for name in usernames)
+        )
+
+
+@receiver(pre_save, sender=Group)
+def remember_group_slug(sender, instance, **kwargs):
+    if instance.pk is not None:
+        instance._saved_slug = Group.objects.filter(
+            pk=instance.pk
+        ).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    if created:
+        GroupStats.objects.get_or_create(group=instance)
+    slugs = {instance.slug, getattr(instance, '_saved_slug', instance.slug)}
+    caching.bump_on_commit(
+        caching.GROUPS,
+        *(caching.GROUP.format(slug=slug) for slug in slugs)
+    )
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    caching.bump_on_commit(
+        caching.POSTS,
+        caching.GROUPS,
+        caching.GROUP.format(slug=instance.slug)
+    )
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_state(sender, instance, **kwargs):
+    if instance.pk is not None:
+        saved = Post.objects.filter(pk=instance.pk).values_list(
+            'group_id', 'image'
+        ).first()
+        instance._saved_group_id, instance._saved_image = saved or (None, '')
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    saved_group_id = getattr(instance, '_saved_group_id', None)
+    with transaction.atomic():
+        if created:
+            stats.count_post(instance, 1)
+            timeline.fan_out(instance)
+        else:
+            stats.move_post(saved_group_id, instance.group_id)
+        if instance.image.name != getattr(instance, '_saved_image', None):
+            thumbnails.enqueue(instance.image.name)
+    invalidate_post(instance, instance.group_id, saved_group_id)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    stats.count_post(instance, -1)
+    invalidate_post(instance, instance.group_id)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        stats.count_comment(instance, 1)
+    caching.bump_on_commit(caching.POST.format(post_id=instance.post_id))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    stats.count_comment(instance, -1)
+    caching.bump_on_commit(caching.POST.format(post_id=instance.post_id))
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        with transaction.atomic():
+            stats.count_follow(instance, 1)
+            timeline.backfill(instance)
+        caching.bump_on_commit(
+            caching.AUTHOR.format(username=instance.author.username),
+            caching.FOLLOWING.format(user_id=instance.user_id)
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    with transaction.atomic():
+        stats.count_follow(instance, -1)
+        timeline.remove(instance)
+    caching.bump_on_commit(
+        caching.AUTHOR.format(username=instance.author.username),
+        caching.FOLLOWING.format(user_id=instance.user_id)
+    )
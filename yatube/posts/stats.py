@@ -0,0 +1,187 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются сигналами атомарным UPDATE ... SET n = n + 1 и
+читаются шаблонами вместо COUNT(*). Расхождения исправляет команда
+recount_stats.
+"""
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import AuthorStats, Comment, DayStats, Follow, GroupStats, Post
+
+
+def _bump(queryset, **deltas):
+    return queryset.update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+
+
+def _bump_many(queryset, key, field, totals, chunk_size=500):
+    """Прибавляет к счётчику field разные значения для многих строк.
+
+    totals - словарь {значение key: прибавка}. Строки с одинаковой
+    прибавкой меняются одним UPDATE, а различных прибавок в пачке
+    обычно немного.
+    """
+    by_delta = defaultdict(list)
+    for value, delta in totals.items():
+        by_delta[delta].append(value)
+    for delta, values in by_delta.items():
+        for start in range(0, len(values), chunk_size):
+            _bump(queryset.filter(
+                **{f'{key}__in': values[start:start + chunk_size]}
+            ), **{field: delta})
+
+
+def bump_author(user_id, **deltas):
+    _bump(AuthorStats.objects.filter(user_id=user_id), **deltas)
+
+
+def bump_group(group_id, delta):
+    if group_id is not None:
+        _bump(GroupStats.objects.filter(group_id=group_id), posts_count=delta)
+
+
+def bump_day(day, delta):
+    """Меняет счётчик постов за день; строка дня заводится при нужде."""
+    if _bump(DayStats.objects.filter(day=day), posts_count=delta):
+        return
+    try:
+        with transaction.atomic():
+            DayStats.objects.create(day=day, posts_count=delta)
+    except IntegrityError:
+        # Строку успел создать параллельный запрос.
+        _bump(DayStats.objects.filter(day=day), posts_count=delta)
+
+
+def count_post(post, delta):
+    bump_author(post.author_id, posts_count=delta)
+    bump_group(post.group_id, delta)
+    bump_day(timezone.localdate(post.pub_date), delta)
+
+
+def count_posts(posts):
+    """Учитывает в счётчиках пачку новых постов."""
+    _bump_many(
+        AuthorStats.objects, 'user_id', 'posts_count',
+        Counter(post.author_id for post in posts)
+    )
+    _bump_many(
+        GroupStats.objects, 'group_id', 'posts_count',
+        Counter(post.group_id for post in posts if post.group_id)
+    )
+    for day, total in Counter(
+        timezone.localdate(post.pub_date) for post in posts
+    ).items():
+        bump_day(day, total)
+
+
+def move_post(old_group_id, new_group_id):
+    if old_group_id != new_group_id:
+        bump_group(old_group_id, -1)
+        bump_group(new_group_id, 1)
+
+
+def count_comment(comment, delta):
+    bump_author(comment.author_id, comments_count=delta)
+
+
+def count_comments(comments):
+    """Учитывает пачку новых комментариев."""
+    _bump_many(
+        AuthorStats.objects, 'user_id', 'comments_count',
+        Counter(comment.author_id for comment in comments)
+    )
+
+
+def count_follow(follow, delta):
+    bump_author(follow.author_id, followers_count=delta)
+    bump_author(follow.user_id, following_count=delta)
+
+
+def count_follows(follows):
+    """Учитывает пачку новых подписок."""
+    _bump_many(
+        AuthorStats.objects, 'user_id', 'followers_count',
+        Counter(follow.author_id for follow in follows)
+    )
+    _bump_many(
+        AuthorStats.objects, 'user_id', 'following_count',
+        Counter(follow.user_id for follow in follows)
+    )
+
+
+def _counts(queryset, field, ids):
+    return dict(
+        queryset.filter(**{f'{field}__in': ids}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values_list(field, 'total')
+    )
+
+
+def recount_authors(user_ids):
+    """Пересчитывает и сохраняет статистику для пачки авторов."""
+    posts = _counts(Post.objects, 'author_id', user_ids)
+    comments = _counts(Comment.objects, 'author_id', user_ids)
+    followers = _counts(Follow.objects, 'author_id', user_ids)
+    following = _counts(Follow.objects, 'user_id', user_ids)
+    existing = set(
+        AuthorStats.objects.filter(user_id__in=user_ids).values_list(
+            'user_id', flat=True
+        )
+    )
+    rows = [
+        AuthorStats(
+            user_id=user_id,
+            posts_count=posts.get(user_id, 0),
+            comments_count=comments.get(user_id, 0),
+            followers_count=followers.get(user_id, 0),
+            following_count=following.get(user_id, 0),
+        )
+        for user_id in user_ids
+    ]
+    AuthorStats.objects.bulk_update(
+        [row for row in rows if row.user_id in existing],
+        ('posts_count', 'comments_count',
+         'followers_count', 'following_count')
+    )
+    AuthorStats.objects.bulk_create(
+        row for row in rows if row.user_id not in existing
+    )
+
+
+def recount_groups(group_ids):
+    """Пересчитывает и сохраняет статистику для пачки групп."""
+    posts = _counts(Post.objects, 'group_id', group_ids)
+    existing = set(
+        GroupStats.objects.filter(group_id__in=group_ids).values_list(
+            'group_id', flat=True
+        )
+    )
+    rows = [
+        GroupStats(group_id=group_id, posts_count=posts.get(group_id, 0))
+        for group_id in group_ids
+    ]
+    GroupStats.objects.bulk_update(
+        [row for row in rows if row.group_id in existing],
+        ('posts_count',)
+    )
+    GroupStats.objects.bulk_create(
+        row for row in rows if row.group_id not in existing
+    )
+
+
+def recount_days():
+    """Пересчитывает счётчики постов по дням заново."""
+    totals = Post.objects.order_by().annotate(
+        day=TruncDate('pub_date')
+    ).values('day').annotate(total=Count('pk')).values_list('day', 'total')
+    DayStats.objects.all().delete()
+    DayStats.objects.bulk_create(
+        DayStats(day=day, posts_count=total) for day, total in totals
+    )
+    return DayStats.objects.count()
@@ -0,0 +1,56 @@
+import hashlib
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+
+def card_key(post, show_profile_link, show_group_link):
+    """Ключ карточки поста.
+
+    Меняется при редактировании поста (поле updated), смене группы и
+    переименовании автора, поэтому старые карточки сбрасывать не нужно.
+    """
+    author = post.author
+    shown = '|'.join((
+        author.username,
+        author.get_full_name(),
+        post.group.slug if post.group_id else '',
+    ))
+    return 'post_card:{}:{}:{:d}{:d}:{}'.format(
+        post.pk,
+        post.updated.timestamp(),
+        bool(show_profile_link),
+        bool(show_group_link),
+        hashlib.md5(shown.encode()).hexdigest()
+    )
+
+
+@register.simple_tag
+def post_cards(posts, show_profile_link=False, show_group_link=False):
+    """HTML карточек постов страницы, из кэша одним запросом get_many.
+
+    Отсутствующие в кэше карточки рендерятся из includes/post.html и
+    сохраняются одним set_many.
+    """
+    posts = list(posts)
+    keys = [
+        card_key(post, show_profile_link, show_group_link) for post in posts
+    ]
+    cards = cache.get_many(keys)
+    missing = {}
+    for key, post in zip(keys, posts):
+        if key not in cards:
+            missing[key] = render_to_string('includes/post.html', {
+                'post': post,
+                'show_profile_link': show_profile_link,
+                'show_group_link': show_group_link,
+            })
+    if missing:
+        cache.set_many(missing, settings.POST_CARD_CACHE_TIMEOUT)
+        cards.update(missing)
+    return [mark_safe(cards[key]) for key in keys]
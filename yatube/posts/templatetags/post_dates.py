@@ -0,0 +1,53 @@
+import copy
+
+from django import template
+from django.contrib.admin.templatetags.admin_list import date_hierarchy
+from django.contrib.admin.views.main import (
+    ALL_VAR, IS_POPUP_VAR, ORDER_VAR, TO_FIELD_VAR
+)
+from django.db.models import Max, Min
+
+from posts.models import DayStats
+
+register = template.Library()
+
+NAVIGATION = {ALL_VAR, IS_POPUP_VAR, ORDER_VAR, TO_FIELD_VAR}
+
+
+class DayStatsDates:
+    """Выборка для date_hierarchy, даты которой берутся из DayStats.
+
+    Реализует только то, что вызывает тег date_hierarchy: границы
+    периода и список дат с постами.
+    """
+
+    def __init__(self, **lookups):
+        self.days = DayStats.objects.filter(posts_count__gt=0, **lookups)
+
+    def aggregate(self, **kwargs):
+        return self.days.aggregate(first=Min('day'), last=Max('day'))
+
+    def dates(self, field_name, kind):
+        return self.days.dates('day', kind)
+
+
+@register.inclusion_tag('admin/date_hierarchy.html')
+def post_date_hierarchy(cl):
+    """date_hierarchy для постов без DISTINCT по всей таблице постов.
+
+    Счётчики по дням не знают о поиске и фильтрах, поэтому с ними
+    используется стандартный тег.
+    """
+    field_name = cl.date_hierarchy
+    parts = {f'{field_name}__{part}': part for part in ('year', 'month')}
+    filters = set(cl.params) - set(parts) - NAVIGATION - {
+        f'{field_name}__day'
+    }
+    if cl.query or filters:
+        return date_hierarchy(cl)
+    rollup = copy.copy(cl)
+    rollup.queryset = DayStatsDates(**{
+        f'day__{part}': cl.params[param]
+        for param, part in parts.items() if param in cl.params
+    })
+    return date_hierarchy(rollup)
@@ -0,0 +1,44 @@
+from django import template
+
+from posts import images, thumbnails
+
+register = template.Library()
+
+
+def fitted_size(post, box=thumbnails.POST_IMAGE_BOX):
+    """Размер картинки поста, вписанной в рамку box (с увеличением).
+
+    Считается по сохранённым размерам картинки, без обращения к файлу.
+    Если размеры ещё неизвестны, возвращается размер рамки.
+    """
+    if not post.image_width or not post.image_height:
+        return box
+    return images.fit((post.image_width, post.image_height), box)
+
+
+@register.inclusion_tag('includes/post_image.html')
+def post_image(post):
+    """Картинка поста с srcset из копий разной ширины.
+
+    Адреса копий подписываются локально, файлы создаются при первом
+    запросе к ним.
+    """
+    name = post.image.name
+    sources = {
+        fitted_size(post, thumbnails.box(width))[0]: thumbnails.url(
+            name, width
+        )
+        for width in thumbnails.POST_IMAGE_WIDTHS
+    }
+    width, height = fitted_size(post)
+    return {
+        'post': post,
+        'width': width,
+        'height': height,
+        'src': sources[max(sources)],
+        'srcset': ', '.join(
+            f'{url} {source_width}w'
+            for source_width, url in sorted(sources.items())
+        ),
+        'sizes': thumbnails.POST_IMAGE_SIZES,
+    }
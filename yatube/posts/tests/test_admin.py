@@ -0,0 +1,115 @@
+import shutil
+import tempfile
+from datetime import date
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, DayStats, Follow, Group, Post, User
+from posts.utils import ApproximatePaginator
+from .constants import SMALL_GIF
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+class AdminChangeListTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='-'
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_rows(self, count):
+        for _ in range(count):
+            post = Post.objects.create(
+                text='Длинный текст поста ' * 20,
+                author=self.author,
+                group=self.group
+            )
+            Comment.objects.create(post=post, author=self.admin, text='-')
+        Follow.objects.get_or_create(user=self.admin, author=self.author)
+
+    def test_queries_do_not_grow_with_rows(self):
+        """Число запросов списка не зависит от числа строк."""
+        for name in ('post', 'comment', 'follow'):
+            url = reverse(f'admin:posts_{name}_changelist')
+            self.add_rows(1)
+            with CaptureQueriesContext(connection) as few:
+                self.client.get(url)
+            self.add_rows(5)
+            with CaptureQueriesContext(connection) as many:
+                response = self.client.get(url)
+            with self.subTest(name=name):
+                self.assertEqual(len(few), len(many))
+                self.assertNotContains(response, 'Длинный текст поста ' * 5)
+
+    def test_approximate_count(self):
+        """Большая таблица не считается целиком."""
+        self.add_rows(5)
+        Post.objects.filter(
+            pk=Post.objects.order_by('pk')[1].pk
+        ).delete()
+        posts = Post.objects.all()
+        with mock.patch.object(ApproximatePaginator, 'exact_limit', 2):
+            self.assertEqual(ApproximatePaginator(posts, 2).count, 5)
+            self.assertEqual(
+                ApproximatePaginator(posts.filter(group=None), 2).count, 0
+            )
+            self.assertEqual(
+                ApproximatePaginator(posts.filter(group=self.group), 2).count,
+                3
+            )
+        self.assertEqual(ApproximatePaginator(posts, 2).count, 4)
+
+    def test_date_hierarchy_reads_day_stats(self):
+        """Годы и месяцы в навигации по датам берутся из DayStats."""
+        self.add_rows(1)
+        DayStats.objects.create(day=date(2001, 5, 3), posts_count=1)
+        url = reverse('admin:posts_post_changelist')
+        response = self.client.get(url)
+        self.assertContains(response, '?pub_date__year=2001')
+        response = self.client.get(url, {'pub_date__year': 2001})
+        self.assertContains(
+            response, '?pub_date__month=5&amp;pub_date__year=2001'
+        )
+        response = self.client.get(url, {'q': 'текст'})
+        self.assertNotContains(response, 'pub_date__year=2001')
+
+    def test_add_post(self):
+        """Пост из админки сохраняется с автором и размерами картинки."""
+        url = reverse('admin:posts_post_add')
+        self.assertContains(self.client.get(url), 'name="author"')
+        image = SimpleUploadedFile(
+            'small.gif', SMALL_GIF, content_type='image/gif'
+        )
+        with self.settings(MEDIA_ROOT=TEMP_MEDIA_ROOT):
+            response = self.client.post(url, {
+                'text': 'Пост из админки',
+                'author': self.author.pk,
+                'group': self.group.pk,
+                'image': image,
+            })
+        self.assertRedirects(
+            response, reverse('admin:posts_post_changelist')
+        )
+        post = Post.objects.get(text='Пост из админки')
+        self.assertEqual(post.author, self.author)
+        self.assertEqual(post.image_width, 2)
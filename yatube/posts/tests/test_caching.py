@@ -0,0 +1,167 @@
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.test import TestCase
+from django.urls import reverse
+
+from posts import caching, degraded
+from posts.models import Group, Post, User
+from .utils import run_on_commit
+
+
+class StampedeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.builds = 0
+
+    def build(self):
+        self.builds += 1
+        time.sleep(0.05)
+        return f'страница {self.builds}'
+
+    def test_concurrent_misses_build_once(self):
+        """Одновременные промахи в потоках строят страницу один раз."""
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                caching.fetch('page', self.build, 60)
+            ))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.builds, 1)
+        self.assertEqual(results, ['страница 1'] * 5)
+        stats = caching.stampede_stats()
+        self.assertEqual(stats['rebuilds'], 1)
+        self.assertEqual(stats['coalesced'] + stats['waited'], 4)
+
+    def test_waits_for_rebuild_in_other_process(self):
+        # Блокировку держит другой процесс, который вскоре кладёт страницу.
+        cache.add(caching._lock_key('page'), True)
+        timer = threading.Timer(0.05, cache.set, args=(
+            'page', ('готовая', 0.05, time.time() + 60)
+        ))
+        timer.start()
+        self.assertEqual(caching.fetch('page', self.build, 60), 'готовая')
+        timer.join()
+        self.assertEqual(self.builds, 0)
+        self.assertEqual(caching.stampede_stats()['waited'], 1)
+
+    def test_early_rebuild(self):
+        """Незадолго до срока страницу перестраивает один запрос."""
+        cache.set('page', ('старая', 10, time.time() + 1))
+        with mock.patch('posts.caching.random.random', return_value=0.5):
+            cache.add(caching._lock_key('page'), True)
+            self.assertEqual(caching.fetch('page', self.build, 60), 'старая')
+            cache.delete(caching._lock_key('page'))
+            self.assertEqual(
+                caching.fetch('page', self.build, 60), 'страница 1'
+            )
+        self.assertEqual(caching.fetch('page', self.build, 60), 'страница 1')
+        stats = caching.stampede_stats()
+        self.assertEqual(stats['stale'], 1)
+        self.assertEqual(stats['early_rebuilds'], 1)
+
+    def test_uncacheable_value_is_not_stored(self):
+        caching.fetch('page', self.build, 60, cacheable=lambda value: False)
+        self.assertIsNone(cache.get('page'))
+        self.assertIsNone(cache.get(caching._lock_key('page')))
+
+
+class DegradedModeTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        Post.objects.create(author=cls.author, text='Старый пост')
+
+    def setUp(self):
+        cache.clear()
+        degraded.feed_breaker.reset()
+        self.addCleanup(degraded.feed_breaker.reset)
+        patcher = mock.patch('posts.degraded.refresh_later')
+        self.refresh_later = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def locked(self):
+        return mock.patch(
+            'posts.views.paginate',
+            side_effect=OperationalError('database is locked')
+        )
+
+    def test_stale_copy_when_database_is_locked(self):
+        url = reverse('posts:index')
+        self.client.get(url)
+        Post.objects.create(author=self.author, text='Новый пост')
+        with self.locked():
+            response = self.client.get(url)
+        self.assertContains(response, 'Старый пост')
+        self.assertNotContains(response, 'Новый пост')
+        self.assertEqual(response['Warning'], '110 - "Response is Stale"')
+        self.assertIn('Age', response)
+        self.assertNotIn('ETag', response)
+        self.refresh_later.assert_called_once()
+        self.assertContains(self.client.get(url), 'Новый пост')
+
+    def test_stale_feed_when_database_is_locked(self):
+        url = reverse('posts:index_rss')
+        self.client.get(url)
+        Post.objects.create(author=self.author, text='Новый пост')
+        run_on_commit()
+
+        def locked(*args):
+            raise OperationalError('database is locked')
+
+        with connection.execute_wrapper(locked):
+            response = self.client.get(url)
+        self.assertContains(response, 'Старый пост')
+        self.assertNotContains(response, 'Новый пост')
+        self.assertEqual(response['Warning'], '110 - "Response is Stale"')
+        self.assertNotIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+
+    def test_breaker_stops_queries(self):
+        url = reverse('posts:group_list', args=(self.group.slug,))
+        with mock.patch(
+            'posts.views.get_object_or_404',
+            side_effect=OperationalError('database is locked')
+        ) as query:
+            for _ in range(settings.FEED_BREAKER_FAILURES + 2):
+                response = self.client.get(url)
+        self.assertEqual(query.call_count, settings.FEED_BREAKER_FAILURES)
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+    def test_breaker_recovers_after_probe(self):
+        breaker = degraded.CircuitBreaker(failures=2, cooldown=0.05)
+        for _ in range(2):
+            with self.assertRaises(OperationalError), breaker.call():
+                raise OperationalError
+        with self.assertRaises(degraded.CircuitOpen), breaker.call():
+            pass
+        time.sleep(0.06)
+        with breaker.call():
+            pass
+        self.assertIsNone(breaker.opened_at)
+
+    def test_budget_interrupts_slow_queries(self):
+        slow = (
+            'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL '
+            'SELECT i + 1 FROM n WHERE i < 100000000) SELECT MAX(i) FROM n'
+        )
+        start = time.monotonic()
+        with self.assertRaises(OperationalError), degraded.db_budget(0.05):
+            with connection.cursor() as cursor:
+                cursor.execute(slow)
+        self.assertLess(time.monotonic() - start, 1)
+        with self.assertRaises(OperationalError), degraded.db_budget(0.01):
+            time.sleep(0.02)
+            Post.objects.count()
+        self.assertEqual(Post.objects.count(), 1)
@@ -0,0 +1,191 @@
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import date
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from posts.models import (
+    Comment, DayStats, Follow, Group, Post, TimelineEntry, User
+)
+
+
+class ImportTest(TestCase):
+    RECORDS = (
+        {'type': 'group', 'slug': 'cats', 'title': 'Коты'},
+        {'type': 'post', 'id': 501, 'author': 'leo', 'text': 'Первый',
+         'group': 'cats', 'pub_date': '2001-05-03T10:00:00+00:00'},
+        {'type': 'follow', 'user': 'reader', 'author': 'leo'},
+        {'type': 'post', 'id': 502, 'author': 'leo', 'text': 'Второй'},
+        {'type': 'comment', 'id': 7, 'post': 501, 'author': 'reader',
+         'text': 'Да'},
+        {'type': 'comment', 'id': 8, 'post': 999, 'author': 'reader',
+         'text': 'Нет'},
+        {'type': 'post', 'id': 503, 'author': 'leo', 'text': 'Чужой',
+         'group': 'dogs'},
+        {'type': 'unknown'},
+    )
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.jsonl')
+        with os.fdopen(handle, 'w') as output:
+            for record in self.RECORDS:
+                output.write(json.dumps(record, ensure_ascii=False) + '\n')
+            output.write('не json\n')
+        self.addCleanup(os.remove, self.path)
+
+    def load(self):
+        stderr = StringIO()
+        call_command(
+            'import_yatube', self.path, batch_size=2,
+            stdout=StringIO(), stderr=stderr
+        )
+        return stderr.getvalue()
+
+    def test_import(self):
+        """Импорт пишет строки, счётчики и ленты, плохие строки пропускает."""
+        errors = self.load()
+        self.assertEqual(len(errors.splitlines()), 4)
+        leo = User.objects.get(username='leo')
+        post = Post.objects.get(pk=501)
+        self.assertEqual((post.author, post.group.slug), (leo, 'cats'))
+        self.assertEqual(post.pub_date.year, 2001)
+        self.assertEqual(
+            list(Post.objects.values_list('pk', flat=True)), [502, 501]
+        )
+        self.assertEqual(post.comments.get().author.username, 'reader')
+        self.assertEqual(leo.stats.posts_count, 2)
+        self.assertEqual(leo.stats.followers_count, 1)
+        self.assertEqual(
+            DayStats.objects.get(day=date(2001, 5, 3)).posts_count, 1
+        )
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(
+                user__username='reader'
+            ).values_list('post_id', flat=True)),
+            {501, 502}
+        )
+
+    def test_import_is_repeatable(self):
+        """Повторный импорт того же файла ничего не дублирует."""
+        self.load()
+        self.load()
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertEqual(
+            User.objects.get(username='leo').stats.posts_count, 2
+        )
+
+
+class ExportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='leo')
+        cls.group = Group.objects.create(
+            title='Коты', slug='cats', description='-'
+        )
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author, text=f'Пост {number}', group=cls.group,
+                image='posts/cat.jpg' if number == 2 else ''
+            )
+            for number in range(5)
+        ]
+        Comment.objects.create(
+            post=cls.posts[0], author=cls.author, text='Мяу'
+        )
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def export(self, **options):
+        call_command(
+            'export_yatube', self.directory, processes=0, part_size=2,
+            stdout=StringIO(), **options
+        )
+        return sorted(os.listdir(self.directory))
+
+    def test_export_jsonl_gzip(self):
+        """Выгрузка делится на части и склеивается в файл для импорта."""
+        names = self.export(gzip=True)
+        self.assertEqual(names, [
+            '0-group-00000.jsonl.gz',
+            '1-post-00000.jsonl.gz',
+            '1-post-00001.jsonl.gz',
+            '1-post-00002.jsonl.gz',
+            '2-comment-00000.jsonl.gz',
+            'media.txt',
+        ])
+        records = []
+        for name in names[:-1]:
+            with gzip.open(os.path.join(self.directory, name), 'rt') as part:
+                records.extend(json.loads(line) for line in part)
+        self.assertEqual(
+            [record['type'] for record in records],
+            ['group'] + ['post'] * 5 + ['comment']
+        )
+        self.assertEqual(records[1], {
+            'type': 'post',
+            'id': self.posts[0].pk,
+            'author': 'leo',
+            'text': 'Пост 0',
+            'group': 'cats',
+            'pub_date': self.posts[0].pub_date.isoformat(),
+            'image': '',
+        })
+        with open(os.path.join(self.directory, 'media.txt')) as manifest:
+            self.assertEqual(manifest.read(), 'posts/cat.jpg\n')
+
+    def test_export_csv(self):
+        """CSV начинается с заголовка."""
+        self.export(format='csv')
+        with open(os.path.join(self.directory, '1-post-00000.csv')) as part:
+            lines = part.read().splitlines()
+        self.assertEqual(lines[0], 'id,author,text,group,pub_date,image')
+        self.assertEqual(len(lines), 3)
+
+    def test_admin_export_csv(self):
+        """Действие админки отдаёт CSV потоком."""
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.client.force_login(admin)
+        response = self.client.post(
+            reverse('admin:posts_post_changelist'),
+            {
+                'action': 'export_csv',
+                'select_across': '1',
+                '_selected_action': [self.posts[0].pk],
+                'index': 0,
+            }
+        )
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[1].startswith(f'{self.posts[0].pk},leo,'))
+
+    def test_csv_formulas_are_escaped(self):
+        """Текст, похожий на формулу, не выполняется в таблице."""
+        Comment.objects.create(
+            post=self.posts[1], author=self.author, text='=HYPERLINK("x")'
+        )
+        Comment.objects.create(
+            post=self.posts[1], author=self.author, text='-1'
+        )
+        texts = []
+        for name in self.export(format='csv'):
+            if '-comment-' in name:
+                with open(os.path.join(self.directory, name)) as part:
+                    texts.extend(row[3] for row in csv.reader(part))
+        self.assertEqual(
+            [text for text in texts if text != 'text'],
+            ['Мяу', "'=HYPERLINK(\"x\")", "'-1"]
+        )
@@ -1,11 +1,13 @@
 import shutil
 import tempfile
+from io import BytesIO
 
 from http import HTTPStatus
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
 from posts.models import Comment, Group, Post, User
 from .constants import (
@@ -86,6 +88,62 @@ class PostFormTests(TestCase):
             response, reverse(PROFILE_URL_NAME, kwargs={'username': self.user})
         )
 
+    @override_settings(IMAGE_MAX_SIDE=300)
+    def test_uploaded_photo_normalized(self):
+        '''Фото уменьшается и перекодируется без EXIF'''
+        photo = Image.new('RGB', (1200, 800), 'red')
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        content = BytesIO()
+        photo.save(content, 'PNG', exif=exif)
+        self.authorized_client.post(
+            reverse(POST_CREATE_URL_NAME),
+            data={
+                'text': 'Фото',
+                'image': SimpleUploadedFile('photo.png', content.getvalue()),
+            }
+        )
+        post = Post.objects.get(text='Фото')
+        self.assertEqual(post.image.name, 'posts/photo.jpg')
+        with Image.open(post.image) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (300, 200))
+            self.assertFalse(image.getexif())
+        self.assertEqual((post.image_width, post.image_height), (300, 200))
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/webp;base64,')
+        )
+        self.assertLess(len(post.image_placeholder), 1000)
+
+    @override_settings(IMAGE_MAX_PIXELS=1)
+    def test_decompression_bomb_rejected(self):
+        '''Картинка с огромным числом пикселей отклоняется'''
+        response = self.authorized_client.post(
+            reverse(POST_CREATE_URL_NAME),
+            data={
+                'text': 'Бомба',
+                'image': SimpleUploadedFile('bomb.gif', SMALL_GIF),
+            }
+        )
+        self.assertFalse(Post.objects.filter(text='Бомба').exists())
+        self.assertIn('image', response.context['form'].errors)
+
+    def test_truncated_photo_rejected(self):
+        '''Обрезанное фото отклоняется ошибкой формы'''
+        content = BytesIO()
+        Image.new('RGB', (300, 200), 'red').save(content, 'JPEG')
+        response = self.authorized_client.post(
+            reverse(POST_CREATE_URL_NAME),
+            data={
+                'text': 'Обрезанное фото',
+                'image': SimpleUploadedFile(
+                    'photo.jpg', content.getvalue()[:-20]
+                ),
+            }
+        )
+        self.assertFalse(Post.objects.filter(text='Обрезанное фото').exists())
+        self.assertIn('image', response.context['form'].errors)
+
     def test_post_edit(self):
         '''Проверка редактирования поста'''
         post = Post.objects.create(
@@ -1,6 +1,15 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
 
-from posts.models import Comment, Follow, Group, Post, User
+from posts.models import (
+    AuthorStats, Comment, DayStats, Follow, Group, GroupStats, Post, User
+)
 
 
 class PostModelTest(TestCase):
@@ -90,3 +99,87 @@ class PostModelTest(TestCase):
         for field, expected_value, h_text in help_text_data:
             with self.subTest(field=field):
                 self.assertEqual(h_text, expected_value)
+
+
+class StatsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='-'
+        )
+        cls.second_group = Group.objects.create(
+            title='Группа 2', slug='group-2', description='-'
+        )
+
+    def assertStats(self, user, **expected):
+        stats = AuthorStats.objects.get(user=user)
+        for field, value in expected.items():
+            with self.subTest(user=user, field=field):
+                self.assertEqual(getattr(stats, field), value)
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются при создании и удалении объектов."""
+        post = Post.objects.create(
+            author=self.author, text='Пост', group=self.group
+        )
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий'
+        )
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertStats(self.author, posts_count=1, followers_count=1)
+        self.assertStats(self.reader, comments_count=1, following_count=1)
+        self.assertEqual(
+            GroupStats.objects.get(group=self.group).posts_count, 1
+        )
+        today = DayStats.objects.get(day=timezone.localdate(post.pub_date))
+        self.assertEqual(today.posts_count, 1)
+
+        post.group = self.second_group
+        post.save()
+        self.assertEqual(
+            GroupStats.objects.get(group=self.group).posts_count, 0
+        )
+        self.assertEqual(
+            GroupStats.objects.get(group=self.second_group).posts_count, 1
+        )
+
+        comment.delete()
+        follow.delete()
+        post.delete()
+        self.assertStats(self.author, posts_count=0, followers_count=0)
+        self.assertStats(self.reader, comments_count=0, following_count=0)
+        today.refresh_from_db()
+        self.assertEqual(today.posts_count, 0)
+
+    def test_recount_stats_repairs_drift(self):
+        """recount_stats восстанавливает испорченные счётчики."""
+        for _ in range(2):
+            Post.objects.create(
+                author=self.author, text='Пост', group=self.group
+            )
+        AuthorStats.objects.filter(user=self.author).update(posts_count=42)
+        GroupStats.objects.filter(group=self.group).delete()
+        DayStats.objects.update(posts_count=0)
+        call_command('recount_stats', batch_size=1, stdout=StringIO())
+        self.assertStats(self.author, posts_count=2)
+        self.assertEqual(
+            GroupStats.objects.get(group=self.group).posts_count, 2
+        )
+        self.assertEqual(
+            list(DayStats.objects.values_list('posts_count', flat=True)),
+            [2]
+        )
+
+    def test_profile_does_not_count(self):
+        """Страница профиля берёт число постов из счётчика."""
+        Post.objects.create(author=self.author, text='Пост')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('posts:profile', args=(self.author.username,))
+            )
+        self.assertContains(response, 'Всего постов: 1')
+        self.assertFalse(
+            [query for query in queries if 'COUNT(' in query['sql']]
+        )
@@ -0,0 +1,10 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+
+class QueryPlanTests(TestCase):
+    def test_feed_queries_use_indexes(self):
+        """Запросы лент и страницы поста не сканируют таблицы целиком."""
+        call_command('check_query_plans', stdout=StringIO())
@@ -1,14 +1,26 @@
+import os
+import re
 import shutil
 import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
 
 from django import forms
 from django.conf import settings
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.core.management import call_command
+from django.test import Client, RequestFactory, TestCase, override_settings
 from django.urls import reverse
 
-from posts.models import Follow, Group, Post, User
+from posts import caching, images, thumbnails, timeline
+from posts.models import (
+    Comment, Follow, Group, Post, ThumbnailJob, TimelineEntry, User
+)
+from posts.templatetags.post_cards import card_key
+from posts.utils import COMMENTS_PER_PAGE, CursorPaginator
 from .constants import (
     MAIN_URL_NAME,
     GROUP_URL_NAME,
@@ -18,6 +30,7 @@ from .constants import (
     POST_EDIT_URL_NAME,
     SMALL_GIF,
 )
+from .utils import run_on_commit
 
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -159,6 +172,160 @@ class PostViewsTests(TestCase):
         new_response = self.authorized_client.get(reverse(MAIN_URL_NAME))
         self.assertNotEqual(old_response.content, new_response.content)
 
+    def test_feed_cache_invalidated_on_write(self):
+        """Страницы лент берутся из кэша и сбрасываются при записи."""
+        for url in (self.MAIN_URL, self.GROUP_URL, self.PROFILE_URL):
+            with self.subTest(url=url):
+                self.guest_client.get(url)
+                with self.assertNumQueries(0):
+                    self.guest_client.get(url)
+                post = Post.objects.create(
+                    text=f'Новый пост {url}',
+                    author=self.user,
+                    group=self.group
+                )
+                self.assertContains(self.guest_client.get(url), post.text)
+
+    def test_cache_invalidated_again_after_commit(self):
+        """Запись начинает поколение сразу и ещё одно после фиксации."""
+        scopes = (caching.POSTS, caching.GROUP.format(slug=self.group.slug))
+        before = caching.generations(scopes)
+        Post.objects.create(text='Пост', author=self.user, group=self.group)
+        written = caching.generations(scopes)
+        run_on_commit()
+        committed = caching.generations(scopes)
+        for generations in zip(before, written, committed):
+            self.assertEqual(len(set(generations)), 3)
+
+    def test_group_page_cache_invalidated_on_group_edit(self):
+        """Изменение группы сразу видно на её странице."""
+        self.guest_client.get(self.GROUP_URL)
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'Новое название'
+        group.save()
+        self.assertContains(
+            self.guest_client.get(self.GROUP_URL), 'Новое название'
+        )
+
+    def test_cached_pages_show_current_user(self):
+        """Закэшированная страница показывает шапку текущего пользователя."""
+        other = User.objects.create_user(username='OtherUser')
+        other_client = Client()
+        other_client.force_login(other)
+        post_url = reverse(
+            POST_DETAIL_URL_NAME, kwargs={'post_id': self.post.pk}
+        )
+        for url in (self.MAIN_URL, self.PROFILE_URL, post_url):
+            with self.subTest(url=url):
+                self.guest_client.get(url)
+                own = self.authorized_client.get(url)
+                foreign = other_client.get(url)
+                self.assertContains(own, 'Пользователь: <a')
+                self.assertContains(own, '>TestUser</a>')
+                self.assertContains(foreign, '>OtherUser</a>')
+                self.assertNotContains(foreign, '>TestUser</a>')
+        self.assertContains(other_client.get(self.PROFILE_URL), 'Подписаться')
+        self.assertNotContains(
+            self.authorized_client.get(self.PROFILE_URL), 'Подписаться'
+        )
+        self.assertContains(
+            self.authorized_client.get(post_url), 'csrfmiddlewaretoken'
+        )
+        self.assertNotContains(
+            self.guest_client.get(post_url), 'csrfmiddlewaretoken'
+        )
+
+    def test_post_cards_cached_until_edit(self):
+        """Карточка поста берётся из кэша и обновляется после правки."""
+        self.guest_client.get(self.MAIN_URL)
+        post = Post.objects.select_related('author', 'group').get(
+            pk=self.post.pk
+        )
+        old_key = card_key(post, True, True)
+        self.assertIn(post.text, cache.get(old_key))
+        self.authorized_client.post(
+            reverse(POST_EDIT_URL_NAME, kwargs={'post_id': post.pk}),
+            {'text': 'Исправленный текст', 'group': self.group.pk}
+        )
+        post.refresh_from_db()
+        self.assertNotEqual(card_key(post, True, True), old_key)
+        self.assertContains(
+            self.guest_client.get(self.MAIN_URL), 'Исправленный текст'
+        )
+
+    def test_post_image_links_signed_copies(self):
+        """Картинка выводится ссылками на копии, создаваемые по запросу."""
+        cache.clear()
+        response = self.guest_client.get(self.MAIN_URL)
+        srcset = re.search(
+            r'<img class="card-img[^>]* srcset="([^"]*)"[^>]* loading="lazy"',
+            response.content.decode()
+        ).group(1).split(', ')
+        self.assertEqual(len(srcset), len(thumbnails.POST_IMAGE_WIDTHS))
+        url = srcset[0].split()[0]
+        response = self.guest_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertTrue(os.path.exists(
+            os.path.join(settings.MEDIA_ROOT, url[len(settings.MEDIA_URL):])
+        ))
+        forged = url.replace('/320-', '/960-')
+        self.assertEqual(self.guest_client.get(forged).status_code, 404)
+
+    def test_broken_image_copy_not_found(self):
+        """Копия обрезанной картинки отдаёт 404, а не ошибку сервера."""
+        name = 'posts/broken.gif'
+        with open(os.path.join(settings.MEDIA_ROOT, name), 'wb') as file:
+            file.write(SMALL_GIF[:20])
+        url = thumbnails.url(name, thumbnails.POST_IMAGE_WIDTHS[0])
+        self.assertEqual(self.guest_client.get(url).status_code, 404)
+
+    def test_thumbnail_worker_creates_copies(self):
+        """Воркер заранее создаёт копии загруженной картинки."""
+        name = self.post.image.name
+        self.assertTrue(ThumbnailJob.objects.filter(image=name).exists())
+        call_command(
+            'thumbnail_worker', processes=0, once=True, stdout=StringIO()
+        )
+        self.assertFalse(ThumbnailJob.objects.exists())
+        for width in thumbnails.POST_IMAGE_WIDTHS:
+            self.assertTrue(os.path.exists(thumbnails.path(name, width)))
+
+    def test_concurrent_first_requests_generate_once(self):
+        """Одновременные первые запросы копии запускают Pillow один раз."""
+        name = self.post.image.name
+        derivative = images.derivative
+        calls = []
+
+        def slow_derivative(*args):
+            calls.append(args)
+            time.sleep(0.1)
+            return derivative(*args)
+
+        with mock.patch('posts.images.derivative', slow_derivative):
+            threads = [
+                threading.Thread(target=thumbnails.ensure, args=(name, 480))
+                for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(os.path.exists(thumbnails.path(name, 480)))
+
+    def test_backfill_images(self):
+        """Команда заполняет размеры и превью старых картинок."""
+        self.assertIsNone(self.post.image_width)
+        call_command(
+            'backfill_images', processes=0, stdout=StringIO()
+        )
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertTrue(post.image_placeholder.startswith('data:image/'))
+        self.assertGreater(post.updated, self.post.updated)
+
     def test_follow_and_unfollow(self):
         """Проверка подписки и отписки на авторов"""
         following_user = User.objects.create(username='FollowingUser')
@@ -199,6 +366,93 @@ class PostViewsTests(TestCase):
         response = self.authorized_client.get(reverse('posts:follow_index'))
         self.assertNotContains(response, post)
 
+    def test_follow_index_reads_timeline(self):
+        """Лента подписок собирается из TimelineEntry одним запросом."""
+        following_user = User.objects.create(username='FollowingUser')
+        old_post = Post.objects.create(
+            text='До подписки', author=following_user
+        )
+        Follow.objects.create(user=self.user, author=following_user)
+        new_post = Post.objects.create(
+            text='После подписки', author=following_user
+        )
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(
+                user=self.user
+            ).values_list('post', flat=True)),
+            {old_post.pk, new_post.pk}
+        )
+        with self.assertNumQueries(1):
+            page_obj = timeline.get_page(
+                RequestFactory().get('/'), self.user
+            )
+            self.assertEqual(list(page_obj), [new_post, old_post])
+        Follow.objects.filter(user=self.user, author=following_user).delete()
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user).exists())
+
+    @override_settings(TIMELINE_LENGTH=2)
+    def test_trim_timelines(self):
+        """Ленты, переросшие длину больше запаса, обрезаются командой."""
+        following_user = User.objects.create(username='FollowingUser')
+        Follow.objects.create(user=self.user, author=following_user)
+        posts = [
+            Post.objects.create(text=f'Пост {number}', author=following_user)
+            for number in range(4)
+        ]
+        entries = TimelineEntry.objects.filter(user=self.user)
+        self.assertEqual(entries.count(), 4)
+        with self.settings(TIMELINE_LENGTH=2):
+            call_command('trim_timelines', slack=2, stdout=StringIO())
+            self.assertEqual(entries.count(), 4)
+            call_command('trim_timelines', slack=1, stdout=StringIO())
+        self.assertEqual(
+            set(entries.values_list('post', flat=True)),
+            {posts[2].pk, posts[3].pk}
+        )
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_follow_index_merges_celebrity_posts(self):
+        """Посты авторов с большим числом подписчиков читаются из Post."""
+        celebrity = User.objects.create(username='Celebrity')
+        Follow.objects.create(user=self.user, author=celebrity)
+        post = Post.objects.create(text='Для всех', author=celebrity)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [post])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_follow_index_pages_through_merged_posts(self):
+        """Страницы ленты со знаменитостью идут по порядку без повторов."""
+        following_user = User.objects.create(username='FollowingUser')
+        celebrity = User.objects.create(username='Celebrity')
+        fan = User.objects.create(username='Fan')
+        Follow.objects.create(user=self.user, author=following_user)
+        Follow.objects.create(user=self.user, author=celebrity)
+        Follow.objects.create(user=fan, author=celebrity)
+        cache.delete(timeline.CELEBRITIES_CACHE_KEY)
+        posts = [
+            Post.objects.create(
+                text=f'Пост {number}',
+                author=(following_user, celebrity)[number % 2]
+            )
+            for number in range(15)
+        ][::-1]
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.user).count(), 8
+        )
+        first = timeline.get_page(RequestFactory().get('/'), self.user)
+        second = timeline.get_page(
+            RequestFactory().get('/', {'cursor': first.next_cursor}),
+            self.user
+        )
+        back = timeline.get_page(
+            RequestFactory().get('/', {'cursor': second.previous_cursor}),
+            self.user
+        )
+        self.assertEqual(list(first) + list(second), posts)
+        self.assertIsNone(second.next_cursor)
+        self.assertEqual(list(back), list(first))
+
 
 class PaginatorViewsTest(TestCase):
     @classmethod
@@ -217,6 +471,8 @@ class PaginatorViewsTest(TestCase):
             author=cls.user,
             group=cls.group) for _ in range(cls.POST_TOTAL))
         Post.objects.bulk_create(cls.posts)
+
+    def setUp(self):
         cache.clear()
 
     def test_page_contains_ten_records(self):
@@ -232,13 +488,288 @@ class PaginatorViewsTest(TestCase):
             reverse(GROUP_URL_NAME, kwargs={'slug': self.group.slug})
         )
         for url_name in urls:
+            cursor = None
             for page, posts_quantity in pages:
                 with self.subTest(url_name=url_name, page=page):
                     if page == 1:
                         response = self.client.get(url_name)
                     else:
-                        response = self.client.get((url_name) + '?page=2')
+                        response = self.client.get(
+                            url_name, {'cursor': cursor}
+                        )
+                    page_obj = response.context.get('page_obj')
+                    cursor = page_obj.next_cursor
                     self.assertEqual(
-                        len(response.context.get('page_obj').object_list),
+                        len(page_obj.object_list),
                         posts_quantity
                     )
+
+    def test_cursor_pages_do_not_overlap(self):
+        """Курсорные страницы идут без пропусков и повторов."""
+        url = reverse(MAIN_URL_NAME)
+        first = self.client.get(url).context['page_obj']
+        second = self.client.get(
+            url, {'cursor': first.next_cursor}
+        ).context['page_obj']
+        back = self.client.get(
+            url, {'cursor': second.previous_cursor}
+        ).context['page_obj']
+        expected = list(Post.objects.order_by('-pub_date', '-pk'))
+        self.assertEqual(list(first) + list(second), expected)
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(first.has_previous())
+        self.assertFalse(second.has_next())
+
+    def test_cursor_page_does_not_count(self):
+        """Курсорная страница выбирается одним запросом без COUNT."""
+        posts = Post.objects.select_related('author', 'group')
+        with self.assertNumQueries(1):
+            page_obj = CursorPaginator(posts, 10).get_page(None)
+            self.assertTrue(page_obj.has_next())
+
+    def test_broken_cursor_returns_first_page(self):
+        """Испорченный курсор не ломает страницу."""
+        response = self.client.get(
+            reverse(MAIN_URL_NAME), {'cursor': '@@not-a-cursor'}
+        )
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+
+class CommentsPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+        cls.post = Post.objects.create(text='Тест', author=cls.user)
+        cls.COMMENTS_TOTAL = COMMENTS_PER_PAGE + 5
+        for number in range(cls.COMMENTS_TOTAL):
+            Comment.objects.create(
+                post=cls.post,
+                author=User.objects.create_user(username=f'reader{number}'),
+                text=f'Комментарий {number}'
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_post_detail_shows_first_comments_page(self):
+        """Пост показывает первую страницу комментариев без N+1."""
+        url = reverse(POST_DETAIL_URL_NAME, kwargs={'post_id': self.post.id})
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        comments = response.context['comments']
+        self.assertEqual(
+            list(comments),
+            list(self.post.comments.order_by('-created', '-pk'))[
+                :COMMENTS_PER_PAGE
+            ]
+        )
+        self.assertContains(response, comments[0].author.username)
+        self.assertIsNotNone(comments.next_cursor)
+
+    def test_load_more_returns_next_comments(self):
+        """Фрагмент «Показать ещё» отдаёт следующую страницу."""
+        url = reverse(POST_DETAIL_URL_NAME, kwargs={'post_id': self.post.id})
+        first = self.client.get(url).context['comments']
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.id}),
+            {'cursor': first.next_cursor}
+        )
+        second = response.context['comments']
+        self.assertEqual(
+            list(first) + list(second),
+            list(self.post.comments.order_by('-created', '-pk'))
+        )
+        self.assertIsNone(second.next_cursor)
+        self.assertNotContains(response, '<html')
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+        cls.post = Post.objects.create(
+            text='Прогулка по Москве', author=cls.user
+        )
+        cls.commented = Post.objects.create(
+            text='Фотографии с дачи', author=cls.user
+        )
+        Comment.objects.create(
+            post=cls.commented, author=cls.user, text='Похоже на Московскую'
+        )
+        Post.objects.create(text='Не про город', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query):
+        response = self.client.get(reverse('posts:search'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return list(response.context['page_obj'])
+
+    def test_search_ranks_posts_above_comments(self):
+        """Поиск находит посты по тексту и комментариям, пост выше."""
+        self.assertEqual(self.search('моск'), [self.post, self.commented])
+
+    def test_search_index_follows_writes(self):
+        """Индекс обновляется при правке и удалении."""
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Прогулка по Казани'
+        post.save()
+        self.assertEqual(self.search('моск'), [self.commented])
+        self.commented.comments.all().delete()
+        self.assertEqual(self.search('моск'), [])
+        self.assertEqual(self.search('казан'), [post])
+
+    def test_search_ignores_query_syntax(self):
+        """Спецсимволы FTS5 в запросе не ломают поиск."""
+        self.assertEqual(self.search('"Москве" AND (NEAR'), [])
+        self.assertEqual(self.search('Москве"*'), [self.post])
+
+    def test_rebuild_search(self):
+        """Команда переиндексации восстанавливает индекс."""
+        call_command('rebuild_search', batch_size=1, stdout=StringIO())
+        self.assertEqual(self.search('моск'), [self.post, self.commented])
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идёт по индексу."""
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'моск'}
+        )
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.post]
+        )
+        response = self.client.get(
+            reverse('admin:posts_comment_changelist'), {'q': 'моск'}
+        )
+        self.assertEqual(len(response.context['cl'].result_list), 1)
+
+
+class FeedTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='leo')
+        cls.group = Group.objects.create(
+            title='Коты', slug='cats', description='Про котов'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='Кот в мешке', group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_feeds_list_posts(self):
+        """Ленты RSS и Atom содержат посты своей страницы."""
+        urls = (
+            reverse('posts:index_rss'),
+            reverse('posts:index_atom'),
+            reverse('posts:group_rss', args=(self.group.slug,)),
+            reverse('posts:group_atom', args=(self.group.slug,)),
+            reverse('posts:profile_rss', args=(self.author.username,)),
+            reverse('posts:profile_atom', args=(self.author.username,)),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertContains(response, 'Кот в мешке')
+                self.assertTrue(response.has_header('ETag'))
+                self.assertTrue(response.has_header('Last-Modified'))
+        self.assertEqual(
+            self.client.get(reverse('posts:group_rss', args=('no',)))
+            .status_code,
+            404
+        )
+
+    def test_unchanged_feed_not_modified(self):
+        """Неизменная лента отдаёт 304 после одного запроса к базе."""
+        url = reverse('posts:group_rss', args=(self.group.slug,))
+        response = self.client.get(url)
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(
+                url, HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(not_modified.status_code, 304)
+        not_modified = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(not_modified.status_code, 304)
+        self.post.text = 'Кот на крыше'
+        self.post.save()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertContains(changed, 'Кот на крыше')
+
+
+class ConditionalPagesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='leo')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+
+    def revalidate(self, url, client=None):
+        client = client or self.client
+        response = client.get(url)
+        self.assertIn('no-cache', response['Cache-Control'])
+        return client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_page_not_modified(self):
+        """Неизменная страница отдаёт 304 без запросов к базе."""
+        url = reverse('posts:index')
+        response = self.client.get(url)
+        self.assertTrue(response.has_header('Last-Modified'))
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(
+                url, HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+        not_modified = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(not_modified.status_code, 304)
+        Post.objects.create(author=self.author, text='Новый пост')
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertContains(changed, 'Новый пост')
+
+    def test_etag_depends_on_user(self):
+        """Пользователь не получает 304 на страницу другого пользователя."""
+        url = reverse('posts:profile', args=(self.author.username,))
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.reader)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+
+    def test_writes_change_etag(self):
+        """Комментарий меняет пост, подписка - ленту подписок."""
+        self.client.force_login(self.reader)
+        detail = reverse('posts:post_detail', args=(self.post.pk,))
+        follow = reverse('posts:follow_index')
+        # Первый ответ с формой ставит CSRF-куку, от которой зависит ETag.
+        self.client.get(detail)
+        self.assertEqual(self.revalidate(detail).status_code, 304)
+        self.assertEqual(self.revalidate(follow).status_code, 304)
+        detail_etag = self.client.get(detail)['ETag']
+        follow_etag = self.client.get(follow)['ETag']
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий'
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(
+            self.client.get(detail, HTTP_IF_NONE_MATCH=detail_etag)
+            .status_code,
+            200
+        )
+        self.assertContains(
+            self.client.get(follow, HTTP_IF_NONE_MATCH=follow_etag), 'Пост'
+        )
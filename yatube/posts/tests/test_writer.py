@@ -0,0 +1,127 @@
+import threading
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TransactionTestCase
+from django.urls import reverse
+
+from posts import writer
+from posts.models import Follow, Post, User
+from .constants import POST_CREATE_URL_NAME, PROFILE_URL_NAME
+
+
+class WriterTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.writer = writer.Writer(batch=100, lock_file='')
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def block(self):
+        """Занимает писателя, пока не выставлено self.release."""
+        def wait():
+            self.started.set()
+            self.release.wait(5)
+        future = self.writer.submit(wait)
+        self.started.wait(5)
+        return future
+
+    def test_writes_are_committed_in_batches(self):
+        events = []
+
+        def write(number):
+            events.append(('write', number))
+            transaction.on_commit(lambda: events.append(('commit', number)))
+            return Post.objects.create(author=self.author, text=str(number))
+
+        self.block()
+        futures = [
+            self.writer.submit(lambda number=number: write(number))
+            for number in range(10)
+        ]
+        self.release.set()
+        posts = [future.result(5) for future in futures]
+        self.assertEqual(
+            events,
+            [('write', number) for number in range(10)]
+            + [('commit', number) for number in range(10)]
+        )
+        self.assertEqual(Post.objects.count(), 10)
+        self.assertEqual(posts[0].text, '0')
+
+    def test_failed_write_does_not_cancel_batch(self):
+        def fail():
+            Post.objects.create(author=self.author, text='Отменённый пост')
+            raise ValueError
+
+        self.block()
+        failed = self.writer.submit(fail)
+        followed = self.writer.submit(lambda: Follow.objects.create(
+            user=self.reader, author=self.author
+        ))
+        self.release.set()
+        with self.assertRaises(ValueError):
+            failed.result(5)
+        followed.result(5)
+        self.assertFalse(Post.objects.exists())
+        self.assertTrue(Follow.objects.filter(user=self.reader).exists())
+
+    def test_timeout_cancels_pending_write(self):
+        self.block()
+        with mock.patch('posts.writer.writer', self.writer):
+            with self.assertRaises(writer.WriteTimeout):
+                writer.run(lambda: Post.objects.create(
+                    author=self.author, text='Пост'
+                ), timeout=0.05)
+        self.release.set()
+        self.writer.submit(lambda: None).result(5)
+        self.assertFalse(Post.objects.exists())
+
+    def test_started_write_is_not_abandoned(self):
+        def slow():
+            self.started.set()
+            self.release.wait(5)
+            return Post.objects.create(author=self.author, text='Пост')
+
+        # Поток-писатель уже запущен и сразу возьмёт запись.
+        self.writer.submit(lambda: None).result(5)
+        threading.Timer(0.2, self.release.set).start()
+        with mock.patch('posts.writer.writer', self.writer):
+            post = writer.run(slow, timeout=0.05)
+        self.assertTrue(self.started.is_set())
+        self.assertEqual(Post.objects.get().pk, post.pk)
+
+    def test_view_answers_503_on_timeout(self):
+        self.client.force_login(self.reader)
+        self.block()
+        with mock.patch('posts.writer.writer', self.writer), \
+                self.settings(WRITE_TIMEOUT=0.05):
+            response = self.client.get(
+                reverse('posts:profile_follow', args=('author',))
+            )
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.release.set()
+        self.writer.submit(lambda: None).result(5)
+        self.assertFalse(Follow.objects.exists())
+
+    def test_view_writes_through_writer(self):
+        self.client.force_login(self.author)
+        index = reverse('posts:index')
+        self.client.get(index)
+        with mock.patch.object(
+            writer.writer, 'submit', wraps=writer.writer.submit
+        ) as submit:
+            response = self.client.post(
+                reverse(POST_CREATE_URL_NAME), {'text': 'Пост писателя'}
+            )
+        submit.assert_called_once()
+        self.assertRedirects(
+            response, reverse(PROFILE_URL_NAME, args=('author',))
+        )
+        self.assertEqual(Post.objects.get().author, self.author)
+        self.assertContains(self.client.get(index), 'Пост писателя')
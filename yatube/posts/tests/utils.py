@@ -0,0 +1,11 @@
+from django.db import connection
+
+
+def run_on_commit():
+    """Выполняет действия, отложенные до фиксации транзакции.
+
+    TestCase не фиксирует транзакцию теста.
+    """
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+    for _, callback in callbacks:
+        callback()
@@ -0,0 +1,180 @@
+"""Копии картинок постов разной ширины для srcset.
+
+Шаблоны ссылаются на копии по подписанному адресу
+MEDIA_URL/thumb/<ширина>-<подпись>/<имя>, не обращаясь ни к хранилищу,
+ни к базе. Первый запрос по адресу создаёт файл копии по тому же пути в
+MEDIA_ROOT, после чего его может отдавать веб-сервер как статику.
+Одновременные первые запросы ждут одну генерацию на блокировке файла.
+
+Картинка, загруженная с постом, ставится в очередь ThumbnailJob, и
+команда thumbnail_worker создаёт её копии заранее.
+"""
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+from django.core import signing
+from django.utils.crypto import constant_time_compare
+from django.utils.encoding import filepath_to_uri
+from PIL import Image
+from sorl.thumbnail.engines import pil_engine
+
+from . import images
+from .models import ThumbnailJob
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Рамка картинки поста и ширины её копий для srcset.
+POST_IMAGE_BOX = (960, 339)
+POST_IMAGE_WIDTHS = (320, 480, 640, 960)
+POST_IMAGE_SIZES = '(max-width: 960px) 100vw, 960px'
+
+THUMB_DIR = 'thumb'
+WEBP = '.webp'
+
+_signer = signing.Signer(salt='posts.thumbnails')
+_local_lock = threading.Lock()
+
+
+def box(width):
+    return width, round(width * POST_IMAGE_BOX[1] / POST_IMAGE_BOX[0])
+
+
+def derivative_name(name):
+    # У JPEG нет прозрачности, остальные форматы копируются в WebP.
+    if name.lower().endswith(('.jpg', '.jpeg')):
+        return name
+    return name + WEBP
+
+
+def source_name(name):
+    """Имя оригинала по имени копии, обратное derivative_name."""
+    return name[:-len(WEBP)] if name.endswith(WEBP) else name
+
+
+def _signature(name, width):
+    return _signer.signature(f'{width}/{name}')
+
+
+def spec(name, width):
+    return f'{width}-{_signature(name, width)}'
+
+
+def check_spec(value, name):
+    """Ширина из подписанной спецификации или None, если подпись неверна."""
+    width, _, signature = value.partition('-')
+    if not width.isdigit() or int(width) not in POST_IMAGE_WIDTHS:
+        return None
+    if not constant_time_compare(signature, _signature(name, int(width))):
+        return None
+    return int(width)
+
+
+def url(name, width):
+    return '{}{}/{}/{}'.format(
+        settings.MEDIA_URL,
+        THUMB_DIR,
+        spec(name, width),
+        filepath_to_uri(derivative_name(name))
+    )
+
+
+def path(name, width):
+    return os.path.join(
+        settings.MEDIA_ROOT,
+        THUMB_DIR,
+        spec(name, width),
+        derivative_name(name)
+    )
+
+
+class _Lock:
+    """Блокировка генерации одной копии между потоками и процессами."""
+
+    def __init__(self, target):
+        self.path = target + '.lock'
+
+    def __enter__(self):
+        if fcntl is None:
+            _local_lock.acquire()
+            return self
+        self.file = open(self.path, 'a')
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl is None:
+            _local_lock.release()
+            return
+        # Ждущие на старом файле после захвата всё равно проверяют,
+        # создана ли копия, поэтому файл блокировки можно удалить.
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+def ensure(name, width):
+    """Путь к копии картинки, создаёт её при первом обращении.
+
+    Файл записывается во временный и переименовывается, поэтому его
+    никогда не увидят недописанным. Возвращает None, если нет оригинала
+    или его не удаётся прочитать.
+    """
+    target = path(name, width)
+    if os.path.exists(target):
+        return target
+    directory = os.path.dirname(target)
+    os.makedirs(directory, exist_ok=True)
+    with _Lock(target):
+        if os.path.exists(target):
+            return target
+        try:
+            content = images.derivative(
+                name,
+                box(width),
+                'JPEG' if derivative_name(name) == name else 'WEBP'
+            )
+        except (OSError, Image.DecompressionBombError):
+            # Файла нет, он обрезан или это не картинка.
+            return None
+        descriptor, temporary = tempfile.mkstemp(dir=directory)
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(content)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, target)
+    return target
+
+
+def enqueue(*names):
+    ThumbnailJob.objects.bulk_create(
+        (ThumbnailJob(image=name) for name in names if name),
+        ignore_conflicts=True
+    )
+
+
+def generate(name):
+    """Создаёт все копии картинки.
+
+    Выполняется в процессе воркера. Возвращает текст ошибки или None.
+    """
+    try:
+        for width in POST_IMAGE_WIDTHS:
+            if ensure(name, width) is None:
+                return f'{name} не найден или повреждён'
+    except Exception as error:
+        return f'{type(error).__name__}: {error}'
+    return None
+
+
+class Engine(pil_engine.Engine):
+    """PIL-движок sorl 12.7 для Pillow 10, где нет Image.ANTIALIAS."""
+
+    def _scale(self, image, width, height):
+        return image.resize((width, height), resample=Image.LANCZOS)
@@ -0,0 +1,220 @@
+"""Материализованные ленты подписок.
+
+Новый пост раскладывается по лентам подписчиков автора (fan-out on write),
+так что лента читается одним запросом по индексу (user, pub_date, post).
+Посты авторов, у которых подписчиков больше TIMELINE_FANOUT_LIMIT, по
+лентам не раскладываются и подмешиваются при чтении.
+
+Раскладка ленты не обрезает: обрезка лент всех подписчиков стоила бы
+больше самой раскладки. Ленты длиннее TIMELINE_LENGTH больше чем на
+TIMELINE_TRIM_SLACK записей обрезает команда trim_timelines.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .models import AuthorStats, Follow, Post, TimelineEntry
+from .utils import POSTS_PER_PAGE, MergedCursorPaginator, paginate
+
+CELEBRITIES_CACHE_KEY = 'timeline:celebrities'
+# Статус автора сбрасывается при подписке и отписке, а таймаут страхует
+# от изменений числа подписчиков в обход сигналов.
+CELEBRITIES_CACHE_TIMEOUT = 60 * 5
+
+
+def has_many_followers(author_id):
+    """Превышает ли число подписчиков автора порог раскладки."""
+    return AuthorStats.objects.filter(
+        user_id=author_id,
+        followers_count__gt=settings.TIMELINE_FANOUT_LIMIT
+    ).exists()
+
+
+def celebrity_ids():
+    """Авторы, посты которых подмешиваются в ленты при чтении."""
+    return cache.get_or_set(
+        CELEBRITIES_CACHE_KEY,
+        lambda: set(
+            AuthorStats.objects.filter(
+                followers_count__gt=settings.TIMELINE_FANOUT_LIMIT
+            ).values_list('user_id', flat=True)
+        ),
+        CELEBRITIES_CACHE_TIMEOUT
+    )
+
+
+def _insert_entries(entries):
+    """Записывает пары (пользователь, (пост, автор, дата)) в ленты."""
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id,
+                post_id=post_id,
+                author_id=author_id,
+                pub_date=pub_date
+            )
+            for user_id, (post_id, author_id, pub_date) in entries
+        ),
+        ignore_conflicts=True
+    )
+
+
+def _add_entries(user_ids, posts):
+    _insert_entries(
+        (user_id, post) for user_id in user_ids for post in posts
+    )
+
+
+def _recent_posts(author_id):
+    return list(
+        Post.objects.filter(author_id=author_id).order_by(
+            '-pub_date', '-pk'
+        ).values_list(
+            'pk', 'author_id', 'pub_date'
+        )[:settings.TIMELINE_LENGTH]
+    )
+
+
+def fan_out(post):
+    """Добавляет новый пост в ленты всех подписчиков автора."""
+    if post.author_id in celebrity_ids():
+        return
+    _add_entries(
+        Follow.objects.filter(author_id=post.author_id).values_list(
+            'user_id', flat=True
+        ),
+        [(post.pk, post.author_id, post.pub_date)]
+    )
+
+
+def fan_out_many(posts):
+    """Раскладывает пачку новых постов по лентам подписчиков авторов."""
+    celebrities = celebrity_ids()
+    by_author = defaultdict(list)
+    for post in posts:
+        if post.author_id not in celebrities:
+            by_author[post.author_id].append(
+                (post.pk, post.author_id, post.pub_date)
+            )
+    _insert_entries(
+        (user_id, post)
+        for author_id, user_id in Follow.objects.filter(
+            author_id__in=list(by_author)
+        ).values_list('author_id', 'user_id')
+        for post in by_author[author_id]
+    )
+
+
+def trim(user_id):
+    """Оставляет в ленте пользователя TIMELINE_LENGTH последних записей."""
+    boundary = TimelineEntry.objects.filter(user_id=user_id).order_by(
+        '-pub_date', '-post'
+    ).values_list('pub_date', 'post_id')[
+        settings.TIMELINE_LENGTH:settings.TIMELINE_LENGTH + 1
+    ]
+    for pub_date, post_id in boundary:
+        TimelineEntry.objects.filter(user_id=user_id).filter(
+            Q(pub_date__lt=pub_date)
+            | Q(pub_date=pub_date, post_id__lte=post_id)
+        ).delete()
+
+
+def overfull_users(slack):
+    """Пользователи, в лентах которых больше TIMELINE_LENGTH + slack записей.
+
+    Считает записи по индексу внешнего ключа user, не читая таблицу.
+    """
+    return TimelineEntry.objects.values('user_id').annotate(
+        entries=Count('*')
+    ).filter(
+        entries__gt=settings.TIMELINE_LENGTH + slack
+    ).values_list('user_id', flat=True)
+
+
+def refresh_celebrity(author_id):
+    """Пересчитывает статус автора после изменения числа подписчиков.
+
+    Если автор опустился ниже порога, его последние посты раскладываются
+    по лентам подписчиков, которые до этого получали их при чтении.
+    """
+    many = has_many_followers(author_id)
+    if many == (author_id in celebrity_ids()):
+        return
+    cache.delete(CELEBRITIES_CACHE_KEY)
+    if not many:
+        _add_entries(
+            Follow.objects.filter(author_id=author_id).values_list(
+                'user_id', flat=True
+            ),
+            _recent_posts(author_id)
+        )
+
+
+def backfill(follow):
+    """Добавляет в ленту подписчика последние посты нового автора."""
+    refresh_celebrity(follow.author_id)
+    if follow.author_id in celebrity_ids():
+        return
+    _add_entries([follow.user_id], _recent_posts(follow.author_id))
+    trim(follow.user_id)
+
+
+def backfill_many(follows):
+    """Как backfill, но для пачки новых подписок."""
+    followers = defaultdict(list)
+    for follow in follows:
+        followers[follow.author_id].append(follow.user_id)
+    for author_id in followers:
+        refresh_celebrity(author_id)
+    celebrities = celebrity_ids()
+    for author_id, user_ids in followers.items():
+        if author_id not in celebrities:
+            _add_entries(user_ids, _recent_posts(author_id))
+    for user_id in {follow.user_id for follow in follows}:
+        trim(user_id)
+
+
+def remove(follow):
+    """Убирает из ленты бывшего подписчика посты автора."""
+    TimelineEntry.objects.filter(
+        user_id=follow.user_id, author_id=follow.author_id
+    ).delete()
+    refresh_celebrity(follow.author_id)
+
+
+def get_page(request, user):
+    """Страница ленты подписок пользователя.
+
+    Обычно это один запрос к TimelineEntry; если пользователь подписан на
+    авторов-знаменитостей, их посты выбираются по индексу автора и
+    сливаются с записями ленты.
+    """
+    celebrities = celebrity_ids()
+    followed = celebrities and list(
+        Follow.objects.filter(
+            user=user, author_id__in=celebrities
+        ).values_list('author_id', flat=True)
+    )
+    entries = user.timeline_entries.select_related(
+        'post__author', 'post__group'
+    )
+    if not followed:
+        page = paginate(request, entries, tie_field='post_id')
+        page.object_list = [entry.post for entry in page.object_list]
+        return page
+    posts = Post.objects.select_related('author', 'group')
+    # Записи ленты, оставшиеся от авторов до того, как они стали
+    # знаменитостями, пришли бы второй раз вместе с их постами.
+    sources = [(entries.exclude(author_id__in=followed), 'post_id')] + [
+        (posts.filter(author_id=author_id), 'pk') for author_id in followed
+    ]
+    page = MergedCursorPaginator(sources, POSTS_PER_PAGE).get_page(
+        request.GET.get('cursor')
+    )
+    page.object_list = [
+        row.post if isinstance(row, TimelineEntry) else row
+        for row in page.object_list
+    ]
+    return page
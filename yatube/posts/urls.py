@@ -1,14 +1,34 @@
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import feeds, thumbnails, views
 
 app_name = 'posts'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('rss/', feeds.posts_rss, name='index_rss'),
+    path('atom/', feeds.posts_atom, name='index_atom'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
+    path('group/<slug:slug>/rss/', feeds.group_rss, name='group_rss'),
+    path('group/<slug:slug>/atom/', feeds.group_atom, name='group_atom'),
     path('profile/<str:username>/', views.profile, name='profile'),
+    path(
+        'profile/<str:username>/rss/',
+        feeds.author_rss,
+        name='profile_rss'
+    ),
+    path(
+        'profile/<str:username>/atom/',
+        feeds.author_atom,
+        name='profile_atom'
+    ),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path(
@@ -16,7 +36,14 @@ urlpatterns = [
         views.add_comment,
         name='add_comment'
     ),
+    path('search/', views.search_posts, name='search'),
     path('follow/', views.follow_index, name='follow_index'),
+    path(
+        f'{settings.MEDIA_URL.lstrip("/")}{thumbnails.THUMB_DIR}/'
+        '<str:spec>/<path:name>',
+        views.post_image,
+        name='post_image'
+    ),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow,
@@ -1,8 +1,198 @@
+import base64
+import binascii
+
 from django.core.paginator import Paginator
+from django.db.models import Max, Min, Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from .models import Comment
+
+POSTS_PER_PAGE = 10
+COMMENTS_PER_PAGE = 20
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(direction, key=None):
+    """Упаковывает направление и ключ (дата, pk) в непрозрачный токен."""
+    raw = direction
+    if key is not None:
+        value, pk = key
+        raw = f'{direction}|{value.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Разбирает токен курсора.
+
+    Возвращает пару (направление, ключ) или None, если токен испорчен.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(
+            token + '=' * (-len(token) % 4)
+        ).decode()
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    direction, *key = raw.split('|')
+    if direction not in (NEXT, PREVIOUS):
+        return None
+    if not key:
+        return direction, None
+    if len(key) != 2 or not key[1].isdigit():
+        return None
+    value = parse_datetime(key[0])
+    if value is None:
+        return None
+    return direction, (value, int(key[1]))
+
+
+class CursorPaginator(Paginator):
+    """Паджинатор по ключу (key_field, tie_field) без COUNT и OFFSET.
+
+    Страница выбирается условием на ключ последней показанной записи,
+    поэтому время выборки не зависит от глубины страницы. Возвращается
+    обычный Page с токенами next_cursor и previous_cursor; его number
+    относительный (1 - первая страница, 2 - любая другая), а num_pages
+    лишь сообщает, есть ли следующая страница.
+    """
+
+    last_cursor = encode_cursor(PREVIOUS)
+
+    def __init__(self, object_list, per_page,
+                 key_field='pub_date', tie_field='pk'):
+        super().__init__(object_list, per_page)
+        self.key_field = key_field
+        self.tie_field = tie_field
+
+    def _check_object_list_is_ordered(self):
+        # Порядок задаётся в get_page по ключу курсора.
+        pass
+
+    def _key(self, obj):
+        return getattr(obj, self.key_field), getattr(obj, self.tie_field)
+
+    def _after(self, key, tie_field):
+        # Лишнее на вид условие __lte позволяет SQLite искать по индексу
+        # диапазоном, а не сканировать его с начала.
+        value, pk = key
+        return Q(**{f'{self.key_field}__lte': value}) & (
+            Q(**{f'{self.key_field}__lt': value})
+            | Q(**{self.key_field: value, f'{tie_field}__lt': pk})
+        )
+
+    def _before(self, key, tie_field):
+        value, pk = key
+        return Q(**{f'{self.key_field}__gte': value}) & (
+            Q(**{f'{self.key_field}__gt': value})
+            | Q(**{self.key_field: value, f'{tie_field}__gt': pk})
+        )
+
+    def _rows(self, queryset, tie_field, key, newest_first):
+        """До per_page + 1 строк queryset за ключом key в порядке страниц."""
+        if newest_first:
+            if key is not None:
+                queryset = queryset.filter(self._after(key, tie_field))
+            order = (f'-{self.key_field}', f'-{tie_field}')
+        else:
+            if key is not None:
+                queryset = queryset.filter(self._before(key, tie_field))
+            order = (self.key_field, tie_field)
+        return list(queryset.order_by(*order)[:self.per_page + 1])
+
+    def _select(self, key, newest_first):
+        return self._rows(self.object_list, self.tie_field, key, newest_first)
+
+    def get_page(self, cursor=None):
+        decoded = decode_cursor(cursor) if cursor else None
+        direction, key = decoded or (NEXT, None)
+        if direction == NEXT:
+            rows = self._select(key, newest_first=True)
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_next, has_previous = has_more, key is not None
+        else:
+            rows = self._select(key, newest_first=False)
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            has_next, has_previous = key is not None, has_more
+        has_next, has_previous = (
+            has_next and bool(rows), has_previous and bool(rows)
+        )
+        page = self._get_page(rows, 1 + has_previous, self)
+        self.num_pages = page.number + has_next
+        page.next_cursor = (
+            encode_cursor(NEXT, self._key(rows[-1])) if has_next else None
+        )
+        page.previous_cursor = (
+            encode_cursor(PREVIOUS, self._key(rows[0]))
+            if has_previous else None
+        )
+        return page
+
+
+class MergedCursorPaginator(CursorPaginator):
+    """CursorPaginator по нескольким выборкам с общим ключом.
+
+    sources - пары (queryset, tie_field). Каждая выборка читается по
+    своему индексу не дальше следующей страницы, а строки сливаются по
+    ключу в Python, поэтому объединение не сортируется в базе.
+    """
+
+    def __init__(self, sources, per_page, key_field='pub_date'):
+        super().__init__(None, per_page, key_field)
+        self.sources = sources
+
+    def _key(self, obj):
+        return obj.cursor_key
+
+    def _select(self, key, newest_first):
+        rows = []
+        for queryset, tie_field in self.sources:
+            for row in self._rows(queryset, tie_field, key, newest_first):
+                row.cursor_key = (
+                    getattr(row, self.key_field), getattr(row, tie_field)
+                )
+                rows.append(row)
+        rows.sort(key=self._key, reverse=newest_first)
+        return rows[:self.per_page + 1]
+
+
+class ApproximatePaginator(Paginator):
+    """Паджинатор, который не считает большую таблицу целиком.
+
+    Строки считаются до exact_limit. Если их больше, число строк
+    выборки без условий оценивается по границам первичного ключа, а для
+    выборки с условиями остаётся досчитанным значением.
+    """
+
+    exact_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list.order_by().values('pk')
+        counted = queryset[:self.exact_limit + 1].count()
+        if counted <= self.exact_limit or queryset.query.where:
+            return counted
+        bounds = queryset.aggregate(first=Min('pk'), last=Max('pk'))
+        return max(counted, bounds['last'] - bounds['first'] + 1)
+
+
+def paginate(request, posts, tie_field='pk'):
+    paginator = CursorPaginator(posts, POSTS_PER_PAGE, tie_field=tie_field)
+    return paginator.get_page(request.GET.get('cursor'))
+
 
+def paginate_comments(request, post_id):
+    """Страница комментариев к посту, от новых к старым.
 
-def paginate(request, posts):
-    posts_per_page = 10
-    paginator = Paginator(posts, posts_per_page)
-    page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+    Выбираются только поля, которые выводит шаблон комментария.
+    """
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author'
+    ).only('text', 'created', 'post_id', 'author__username')
+    paginator = CursorPaginator(
+        comments, COMMENTS_PER_PAGE, key_field='created'
+    )
+    return paginator.get_page(request.GET.get('cursor'))
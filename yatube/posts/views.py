@@ -1,13 +1,20 @@
+import functools
+
 from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.http import FileResponse, Http404
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.views.decorators.http import require_safe
 
+from . import caching, search, thumbnails, timeline, writer
+from .caching import cache_feed, conditional_page
 from .models import Group, Follow, Post, User
 from .forms import CommentForm, PostForm
-from .utils import paginate
+from .utils import POSTS_PER_PAGE, paginate, paginate_comments
 
 
-@cache_page(20, key_prefix='index_page')
+@conditional_page(caching.POSTS, caching.GROUPS, caching.USERS)
+@cache_feed(caching.POSTS, caching.GROUPS, caching.USERS)
 def index(request):
     posts = Post.objects.select_related('author', 'group')
     return render(
@@ -17,6 +24,8 @@ def index(request):
     )
 
 
+@conditional_page(caching.GROUP, caching.USERS)
+@cache_feed(caching.GROUP, caching.USERS)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
     return render(
@@ -32,8 +41,13 @@ def group_posts(request, slug):
     )
 
 
+@conditional_page(caching.AUTHOR, caching.GROUPS)
+@cache_feed(caching.AUTHOR, caching.GROUPS)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(
+        User.objects.select_related('stats'),
+        username=username
+    )
     return render(
         request,
         'posts/profile.html',
@@ -43,29 +57,54 @@ def profile(request, username):
                 request,
                 author.posts.select_related('author', 'group')
             ),
-            'following': (
-                request.user.is_authenticated and Follow.objects.filter(
-                    user=request.user.id, author=author
-                ).exists()
-            )
         }
     )
 
 
+@conditional_page(caching.POST, caching.GROUPS, caching.USERS)
+@cache_feed(caching.POST, caching.GROUPS, caching.USERS)
 def post_detail(request, post_id):
     post = get_object_or_404(
         Post.objects.select_related('author', 'group'),
         pk=post_id
     )
-    form = CommentForm(request.POST or None)
     return render(
         request,
         'posts/post_detail.html',
-        {'post': post, 'form': form}
+        {'post': post, 'comments': paginate_comments(request, post_id)}
+    )
+
+
+@cache_feed(caching.POST, caching.USERS)
+def post_comments(request, post_id):
+    get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    return render(
+        request,
+        'includes/comment_list.html',
+        {'post_id': post_id, 'comments': paginate_comments(request, post_id)}
+    )
+
+
+def search_posts(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = Paginator(
+        search.ranked_post_ids(query), POSTS_PER_PAGE
+    ).get_page(request.GET.get('page'))
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        page_obj.object_list
+    )
+    page_obj.object_list = [
+        posts[pk] for pk in page_obj.object_list if pk in posts
+    ]
+    return render(
+        request,
+        'posts/search.html',
+        {'query': query, 'page_obj': page_obj}
     )
 
 
 @login_required
+@writer.unavailable_on_timeout
 def post_create(request):
     template = 'posts/create_post.html'
     form = PostForm(
@@ -81,11 +120,12 @@ def post_create(request):
         return render(request, template, context)
     post = form.save(commit=False)
     post.author = request.user
-    post.save()
+    writer.run(post.save)
     return redirect('posts:profile', request.user.username)
 
 
 @login_required
+@writer.unavailable_on_timeout
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = PostForm(
@@ -96,7 +136,7 @@ def post_edit(request, post_id):
     if post_id and request.user != post.author:
         return redirect('posts:post_detail', post_id=post_id)
     if form.is_valid():
-        form.save()
+        writer.run(form.save)
         return redirect('posts:post_detail', post_id=post_id)
     return render(
         request,
@@ -106,6 +146,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@writer.unavailable_on_timeout
 def add_comment(request, post_id):
     post = Post.objects.get(pk=post_id)
     form = CommentForm(request.POST or None)
@@ -113,33 +154,60 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        writer.run(comment.save)
     return redirect('posts:post_detail', post_id=post_id)
 
 
+# Лента подписок меняется с любым постом и с набором подписок.
 @login_required
+@conditional_page(
+    caching.POSTS, caching.GROUPS, caching.USERS, caching.FOLLOWING
+)
 def follow_index(request):
-    posts = Post.objects.select_related('author', 'group').filter(
-        author__following__user=request.user)
     return render(
         request,
         'posts/follow.html',
-        {'page_obj': paginate(request, posts)}
+        {'page_obj': timeline.get_page(request, request.user)}
     )
 
 
 @login_required
+@writer.unavailable_on_timeout
 def profile_follow(request, username):
     following = get_object_or_404(User, username=username)
     if request.user != following:
-        Follow.objects.get_or_create(user=request.user, author=following)
+        writer.run(functools.partial(
+            Follow.objects.get_or_create, user=request.user, author=following
+        ))
     return redirect('posts:profile', username)
 
 
 @login_required
+@writer.unavailable_on_timeout
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     follow = Follow.objects.filter(user=request.user, author=author)
     if follow.exists():
-        follow.delete()
+        writer.run(follow.delete)
     return redirect('posts:profile', username)
+
+
+@require_safe
+def post_image(request, spec, name):
+    """Копия картинки поста, созданная при первом запросе.
+
+    Не обращается к базе. Адрес копии неизменен, пока жив файл оригинала,
+    поэтому ответ кэшируется надолго.
+    """
+    source = thumbnails.source_name(name)
+    width = thumbnails.check_spec(spec, source)
+    path = width and thumbnails.ensure(source, width)
+    if not path:
+        raise Http404('Картинка не найдена')
+    response = FileResponse(
+        open(path, 'rb'),
+        content_type='image/webp' if path.endswith(thumbnails.WEBP)
+        else 'image/jpeg'
+    )
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
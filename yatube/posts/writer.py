@@ -0,0 +1,184 @@
+"""Запись в базу одним потоком-писателем на процесс.
+
+SQLite пускает одного писателя за раз. Запросы, пишущие одновременно,
+ждут друг друга в busy handler, а транзакция, которая начала с чтения и
+не может перейти к записи, сразу получает database is locked. Поэтому
+записи из запросов выполняет поток-писатель: он берёт их из очереди
+пачками и фиксирует каждую пачку одной транзакцией (group commit), так
+что на пачку приходится одна блокировка и одна синхронизация с диском.
+Писатели разных процессов чередуются по блокировке файла и не
+соперничают за базу.
+"""
+import functools
+import os
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Без fcntl писатель один на процесс, и разные процессы за базу
+# соперничают, как без очереди.
+_local_lock = threading.Lock()
+
+
+class WriteTimeout(Exception):
+    """Запись не выполнена за отведённое время."""
+
+
+@receiver(connection_created)
+def use_wal(sender, connection, **kwargs):
+    """Включает WAL: читатели не мешают писателю и не ждут его."""
+    if connection.vendor == 'sqlite' and not connection.is_in_memory_db():
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode = WAL')
+
+
+class Writer:
+    """Очередь записей и поток, выполняющий их пачками до batch штук.
+
+    Каждая запись выполняется в своей точке сохранения: ошибка отменяет
+    только её, остальные записи пачки фиксируются. Результат записи
+    становится известен после фиксации всей пачки. Сигналы записей
+    повторно сбрасывают кэш после фиксации, см. caching.bump_on_commit:
+    страницы, собранные, пока пачка не зафиксирована, не остаются в кэше.
+    """
+
+    def __init__(self, batch, lock_file):
+        self.batch = batch
+        self.lock_file = lock_file
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+
+    def submit(self, func):
+        """Ставит func в очередь и возвращает Future её результата."""
+        with self.lock:
+            # После fork потока-писателя в дочернем процессе нет.
+            if self.pid != os.getpid() or not self.thread.is_alive():
+                self.pid = os.getpid()
+                self.queue = queue.Queue()
+                self.thread = threading.Thread(
+                    target=self.loop, args=(self.queue,), daemon=True
+                )
+                self.thread.start()
+            future = Future()
+            self.queue.put((func, future))
+        return future
+
+    def loop(self, tasks):
+        while True:
+            batch = [tasks.get()]
+            while len(batch) < self.batch:
+                try:
+                    batch.append(tasks.get_nowait())
+                except queue.Empty:
+                    break
+            self.commit([
+                (func, future) for func, future in batch
+                if future.set_running_or_notify_cancel()
+            ])
+
+    def commit(self, batch):
+        if not batch:
+            return
+        results = []
+        try:
+            with self.file_lock(), transaction.atomic():
+                for func, future in batch:
+                    try:
+                        with transaction.atomic():
+                            results.append((future, func(), None))
+                    except Exception as error:
+                        results.append((future, None, error))
+        except Exception as error:
+            connection.close()
+            for _, future in batch:
+                future.set_exception(error)
+            return
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def file_lock(self):
+        if connection.vendor != 'sqlite' or connection.is_in_memory_db():
+            return _NoLock()
+        if fcntl is None:
+            return _local_lock
+        return _FileLock(self.lock_file)
+
+
+class _NoLock:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class _FileLock:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(path, 'a')
+
+    def __enter__(self):
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+writer = Writer(settings.WRITE_BATCH, settings.WRITE_LOCK_FILE)
+
+
+def run(func, timeout=None):
+    """Выполняет func в потоке-писателе и возвращает её результат.
+
+    Ошибка func выбрасывается здесь же. Если за timeout секунд
+    (по умолчанию WRITE_TIMEOUT) запись не началась, она отменяется и
+    выбрасывается WriteTimeout. Начатая запись дожидается фиксации:
+    повтор запроса после ответа 503 записал бы её второй раз. Внутри
+    транзакции func выполняется сразу: писатель не увидел бы
+    незафиксированных данных вызывающего.
+    """
+    if connection.in_atomic_block:
+        with transaction.atomic():
+            return func()
+    future = writer.submit(func)
+    try:
+        return future.result(
+            settings.WRITE_TIMEOUT if timeout is None else timeout
+        )
+    except TimeoutError:
+        if future.cancel():
+            raise WriteTimeout
+        return future.result()
+
+
+def unavailable_on_timeout(view):
+    """Отвечает 503, если запись представления не успела выполниться."""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except WriteTimeout:
+            response = HttpResponse(
+                'Сервис временно недоступен, попробуйте позже.',
+                content_type='text/plain; charset=utf-8', status=503
+            )
+            response['Retry-After'] = 1
+            return response
+    return wrapper
@@ -117,10 +117,64 @@ LOGIN_REDIRECT_URL = 'posts:index'
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
+# Кэш общий для всех процессов сервера, самые читаемые записи ещё и
+# копируются в память процесса, см. core.cache.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.HotCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'MAX_BYTES': 256 * 1024 * 1024,
+            'HOT_MAX_ENTRIES': 300,
+            'HOT_MAX_BYTES': 16 * 1024 * 1024,
+            'HOT_TIMEOUT': 60,
+        },
     }
 }
+# Тесты переносят кэш во временный файл, см. core.testing.
+TEST_RUNNER = 'core.testing.TestRunner'
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
+
+# Лента подписок: длина материализованной ленты пользователя и число
+# подписчиков, начиная с которого посты автора не раскладываются по лентам,
+# а подмешиваются при чтении.
+TIMELINE_LENGTH = 1000
+TIMELINE_FANOUT_LIMIT = 5000
+# На сколько записей лента может перерасти TIMELINE_LENGTH, пока её не
+# обрежет команда trim_timelines.
+TIMELINE_TRIM_SLACK = 200
+
+# Страницы лент сбрасываются сигналами при записи, поэтому могут жить долго.
+# Ключ карточки поста меняется при правке поста, её не нужно сбрасывать.
+FEED_CACHE_TIMEOUT = 60 * 60 * 6
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Когда база не отвечает: сколько секунд страница ленты может ждать её
+# запросы, после скольких ошибок подряд процесс перестаёт обращаться к
+# базе и на сколько секунд, сколько хранится последняя удачная копия
+# страницы, которая отдаётся вместо ошибки.
+FEED_DB_BUDGET = 2
+FEED_BREAKER_FAILURES = 3
+FEED_BREAKER_COOLDOWN = 10
+STALE_PAGE_TIMEOUT = 60 * 60 * 24
+
+# Записи из запросов выполняет поток-писатель, см. posts.writer: сколько
+# записей он фиксирует одной транзакцией, сколько секунд запрос ждёт свою
+# запись и файл, по которому чередуются писатели разных процессов.
+WRITE_BATCH = 100
+WRITE_TIMEOUT = 10
+WRITE_LOCK_FILE = os.path.join(BASE_DIR, 'cache', 'writer.lock')
+
+# sorl-thumbnail 12.7 обращается к Image.ANTIALIAS, которого нет в Pillow 10.
+THUMBNAIL_ENGINE = 'posts.thumbnails.Engine'
+
+# Картинки постов при загрузке уменьшаются до IMAGE_MAX_SIDE по большей
+# стороне, а картинки больше IMAGE_MAX_PIXELS отклоняются до декодирования.
+IMAGE_MAX_SIDE = 2560
+IMAGE_MAX_PIXELS = 40 * 10 ** 6
+IMAGE_QUALITY = 85
+
+# Поиск показывает не больше стольких самых релевантных постов.
+SEARCH_RESULTS_LIMIT = 1000